@@ -15,12 +15,33 @@
 # O executável ficará em dist/
 # =============================================================================
 
+import bisect
+import codecs
+import ctypes
+import ctypes.util
+import io
+import itertools
+import json
+import mmap
 import os
+import re
+import select
+import stat
+import struct
 import sys
 import time
+import tokenize
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import threading
+from array import array
 import queue
 import fnmatch
+import gzip
+import hashlib
+import heapq
+import lzma
+import multiprocessing
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from tkinter import scrolledtext
@@ -34,12 +55,118 @@ REPLACEMENT_CHAR = "\ufffd"
 REPLACEMENT_RATIO_THRESHOLD = 0.01
 REPLACEMENT_ABS_THRESHOLD = 100
 
+# Detecção de codificação
+DEFAULT_FALLBACK_ENCODINGS = "cp1252,latin-1"
+ENCODING_SAMPLE_BYTES = 64 * 1024
+ENCODING_CACHE_MAX = 100000
+# UTF-32 antes de UTF-16: o BOM UTF-32 LE começa com o BOM UTF-16 LE
+BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+)
+# Bytes comuns em texto; o resto (controles) indica binário nas alternativas
+TEXT_BYTES = bytes(range(32, 127)) + b"\t\n\r\f\b\x1b" + bytes(range(128, 256))
+BINARY_CONTROL_RATIO = 0.1
+
 SKIP_DIRS = {
     "node_modules", ".pnpm", ".yarn", ".turbo",
     "venv", ".venv", "env", ".env", ".tox", ".mypy_cache", "__pycache__",
     ".git", ".hg", ".svn", ".idea", ".vscode", "dist", "build"
 }
 
+# Compactação do corpo dos arquivos
+HASH_COMMENT_EXTS = {".py", ".yml", ".yaml", ".sh", ".rb", ".toml"}
+C_COMMENT_EXTS = {".js", ".ts", ".jsx", ".tsx", ".css", ".scss", ".java", ".c", ".h", ".cpp", ".hpp", ".cs", ".go"}
+LINE_COMMENT_EXTS = C_COMMENT_EXTS - {".css"}
+STRIP_COMMENT_EXTS = {".py", ".js", ".ts", ".css"}
+# Palavras após as quais "/" abre um literal de regex (e não uma divisão)
+JS_REGEX_KEYWORDS = {
+    "return", "typeof", "instanceof", "in", "of", "new", "delete", "void",
+    "throw", "case", "do", "else", "yield", "await",
+}
+LICENSE_KEYWORDS = ("copyright", "license", "licence", "spdx-license-identifier", "all rights reserved")
+
+# Orçamento de saída
+CHARS_PER_TOKEN = 4
+BUDGET_POLICIES = {
+    "Ordem de seleção": "selection",
+    "Menores primeiro": "smallest",
+    "Prioridade por extensão": "ext_priority",
+}
+DEFAULT_BUDGET_POLICY = "Ordem de seleção"
+
+# Flags da tabela de caminhos
+FLAG_DIR = 1
+FLAG_REMOVED = 2
+FLAG_SELECTED = 4
+
+# Observação de mudanças no disco
+WATCH_LIMIT = 8192
+POLL_WATCH_LIMIT = 2048
+POLL_INTERVAL_S = 2.0
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_LISTING_MASK = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+IN_WATCH_MASK = IN_LISTING_MASK | IN_MODIFY | IN_CLOSE_WRITE | IN_DELETE_SELF | IN_MOVE_SELF
+
+# Leitura em processos paralelos (seleções muito grandes)
+MP_MIN_FILES = 2000  # abaixo disso a leitura fica na própria thread
+MP_BATCH_FILES = 256
+MP_BATCH_BYTES = 8 * 1024 * 1024
+MP_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+
+# Seleção por conteúdo: a varredura é quase toda CPU (regex sobre bytes), então
+# processos compensam bem antes da leitura; abaixo do limite, threads ainda
+# sobrepõem stat/open/mmap
+GREP_MP_MIN_FILES = 200
+GREP_WORKERS = min(8, os.cpu_count() or 2)
+
+# Pré-leitura em segundo plano
+PREFETCH_CACHE_BYTES = 64 * 1024 * 1024
+PREFETCH_NICE = 10
+STATUS_LABELS = {
+    "ok": "pronto",
+    "too_large": "maior que o limite",
+    "binary_nul": "provável binário",
+    "binary_ratio": "provável binário",
+    "not_found": "não encontrado",
+    "no_perm": "sem permissão",
+}
+
+# Busca fuzzy
+SEARCH_LIMIT = 200
+SEARCH_DEBOUNCE_MS = 60
+
+# Links simbólicos
+SYMLINK_POLICIES = {
+    "Seguir uma vez": "follow_once",
+    "Seguir": "follow",
+    "Ignorar": "skip",
+}
+DEFAULT_SYMLINK_POLICY = "Seguir uma vez"
+
+# Arquivo de projeto
+PROJECT_VERSION = 1
+
+# Painel de estimativa
+ESTIMATE_TOP_N = 3
+ESTIMATE_DEBOUNCE_MS = 150
+
+# Saída em partes e compressão
+MIN_PART_CHARS = 1024
+COMPRESS_EXTS = (".gz", ".xz")
+DEFAULT_COMPRESS_LEVEL = 6
 
 
 def rp(p):
@@ -52,6 +179,14 @@ def now_hhmmss():
     return time.strftime("%H:%M:%S")
 
 
+def fmt_bytes(n):
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024.0
+    return f"{n:.1f} GB"
+
+
 def norm_case_path(p):
     try:
         return os.path.normcase(os.path.abspath(os.path.normpath(p)))
@@ -59,16 +194,112 @@ def norm_case_path(p):
         return os.path.abspath(p)
 
 
-def is_subpath(child, parent):
-    child = norm_case_path(child)
-    parent = norm_case_path(parent)
-    if child == parent:
-        return True
-    try:
-        common = os.path.commonpath([child, parent])
-    except Exception:
+class PathTable:
+    # Tabela compacta de caminhos. Cada caminho é guardado uma única vez como
+    # (handle do pai, nome) e referenciado por um handle inteiro; o caminho
+    # completo só é montado sob demanda com path(). Os nomes são normcase e
+    # internados, e as flags (FLAG_*) ficam num bytearray paralelo.
+    __slots__ = ("parents", "names", "flags", "children", "lock")
+
+    def __init__(self):
+        self.parents = array("i")
+        self.names = []
+        self.flags = bytearray()
+        self.children = {}  # handle do pai (-1 = âncora) -> {nome: handle}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.names)
+
+    def child(self, parent, name, is_dir=None):
+        name = os.path.normcase(name)
+        kids = self.children.get(parent)
+        h = kids.get(name) if kids is not None else None
+        if h is None:
+            with self.lock:
+                kids = self.children.setdefault(parent, {})
+                h = kids.get(name)
+                if h is None:
+                    h = len(self.names)
+                    self.parents.append(parent)
+                    self.names.append(sys.intern(name))
+                    self.flags.append(0)
+                    kids[name] = h
+        if is_dir is not None and bool(self.flags[h] & FLAG_DIR) != is_dir:
+            self.set_flag(h, FLAG_DIR, is_dir)
+        return h
+
+    def add(self, path, is_dir=None):
+        # Interna um caminho completo e retorna seu handle
+        p = norm_case_path(path)
+        parts = []
+        while True:
+            head, tail = os.path.split(p)
+            if not tail:
+                break
+            parts.append(tail)
+            p = head
+        h = self.child(-1, p)
+        for name in reversed(parts):
+            h = self.child(h, name)
+        if is_dir is not None:
+            self.set_flag(h, FLAG_DIR, is_dir)
+        return h
+
+    def path(self, h):
+        parts = []
+        while h >= 0:
+            parts.append(self.names[h])
+            h = self.parents[h]
+        parts.reverse()
+        return os.path.join(*parts)
+
+    def name(self, h):
+        return self.names[h]
+
+    def parent(self, h):
+        return self.parents[h]
+
+    def has_flag(self, h, flag):
+        return bool(self.flags[h] & flag)
+
+    def set_flag(self, h, flag, on=True):
+        if on:
+            self.flags[h] |= flag
+        else:
+            self.flags[h] &= ~flag & 0xFF
+
+    def is_dir(self, h):
+        return bool(self.flags[h] & FLAG_DIR)
+
+    def flag_in_chain(self, h, flag):
+        # True se h ou algum ancestral tiver a flag
+        flags = self.flags
+        parents = self.parents
+        while h >= 0:
+            if flags[h] & flag:
+                return True
+            h = parents[h]
+        return False
+
+    def is_within(self, h, ancestor):
+        parents = self.parents
+        while h >= 0:
+            if h == ancestor:
+                return True
+            h = parents[h]
         return False
-    return common == parent
+
+    def relpath(self, h, ancestor):
+        # Caminho relativo em estilo posix ("" se h == ancestor, None se fora)
+        parts = []
+        while h != ancestor:
+            if h < 0:
+                return None
+            parts.append(self.names[h])
+            h = self.parents[h]
+        parts.reverse()
+        return "/".join(parts)
 
 
 class GitIgnore:
@@ -142,6 +373,1111 @@ class GitIgnore:
         return bool(result)
 
 
+# =============================================================================
+# Compactação de conteúdo
+# =============================================================================
+def collapse_blank_runs(text):
+    # Reduz sequências de linhas em branco a uma única linha em branco
+    return re.sub(r"\n(?:[ \t]*\n){2,}", "\n\n", text)
+
+
+def strip_trailing_whitespace(text):
+    return re.sub(r"[ \t]+$", "", text, flags=re.M)
+
+
+def _comment_prefixes(ext):
+    if ext in HASH_COMMENT_EXTS:
+        return ("#",)
+    if ext in LINE_COMMENT_EXTS:
+        return ("//", "/*", "*")
+    if ext in C_COMMENT_EXTS:
+        return ("/*", "*")
+    return ()
+
+
+def strip_license_banner(text, ext):
+    # Remove o bloco de comentários inicial se mencionar licença/copyright.
+    # Preserva shebang e linhas em branco antes do bloco não são contadas.
+    prefixes = _comment_prefixes(ext)
+    if not prefixes:
+        return text
+    lines = text.split("\n")
+    i = 0
+    if lines and lines[0].startswith("#!"):
+        i = 1
+    start = i
+    while i < len(lines) and not lines[i].strip():
+        i += 1
+    block_start = i
+    in_block = False
+    while i < len(lines):
+        stripped = lines[i].strip()
+        if in_block:
+            i += 1
+            if "*/" in stripped:
+                in_block = False
+            continue
+        if stripped.startswith("/*") and "/*" in prefixes:
+            in_block = "*/" not in stripped[2:]
+            i += 1
+            continue
+        if stripped and stripped.startswith(prefixes):
+            i += 1
+            continue
+        break
+    if in_block or i == block_start:
+        return text
+    banner = "\n".join(lines[block_start:i]).lower()
+    if not any(k in banner for k in LICENSE_KEYWORDS):
+        return text
+    while i < len(lines) and not lines[i].strip():
+        i += 1
+    return "\n".join(lines[:start] + lines[i:])
+
+
+def strip_python_comments(text):
+    # Usa tokenize para localizar comentários reais (ignora '#' dentro de strings)
+    lines = text.split("\n")
+    cuts = {}
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(text).readline):
+            if tok.type == tokenize.COMMENT:
+                row, col = tok.start
+                if row == 1 and tok.string.startswith("#!"):
+                    continue
+                cuts[row - 1] = col
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return text
+    if not cuts:
+        return text
+    out = []
+    for idx, line in enumerate(lines):
+        col = cuts.get(idx)
+        if col is None:
+            out.append(line)
+            continue
+        kept = line[:col].rstrip()
+        if kept:
+            out.append(kept)
+    return "\n".join(out)
+
+
+def strip_c_comments(text, line_comments=True):
+    # Remove /* */ (e // se line_comments) respeitando strings e, de forma
+    # heurística, literais de regex do JavaScript. Se um comentário pode estar
+    # dentro de uma regex após "/" ambíguo (após ")" ou "}"), devolve o texto
+    # intacto em vez de arriscar cortar código.
+    out = []
+    touched = set()
+    line_no = 0
+    n = len(text)
+    i = 0
+    last_sig = ""
+    last_word = ""
+    unsure_at = -1
+    while i < n:
+        c = text[i]
+        nxt = text[i + 1] if i + 1 < n else ""
+        if c in "\"'`":
+            j = i + 1
+            while j < n and text[j] != c:
+                if text[j] == "\\":
+                    j += 1
+                elif text[j] == "\n" and c != "`":
+                    break
+                j += 1
+            chunk = text[i:j + 1]
+            out.append(chunk)
+            line_no += chunk.count("\n")
+            last_sig = c
+            i = j + 1
+            continue
+        if c == "/" and nxt and nxt in "*/" and unsure_at >= 0:
+            span = text[unsure_at + 1:i]
+            if "\n" not in span and ("\\" in span or "[" in span):
+                return text
+        if c == "/" and nxt == "*":
+            j = text.find("*/", i + 2)
+            j = n if j < 0 else j + 2
+            prev = out[-1][-1:] if out else ""
+            after = text[j:j + 1]
+            if prev and after and not prev.isspace() and not after.isspace():
+                out.append(" ")
+            touched.add(line_no)
+            i = j
+            continue
+        if c == "/" and nxt == "/" and line_comments:
+            j = text.find("\n", i)
+            j = n if j < 0 else j
+            touched.add(line_no)
+            i = j
+            continue
+        regex_ok = (not last_sig or last_sig in "(,=:[!&|?{;+-*%<>~^"
+                    or (last_sig == "w" and last_word in JS_REGEX_KEYWORDS))
+        if c == "/" and line_comments and not regex_ok and last_sig in ")}":
+            unsure_at = i
+        if c == "/" and line_comments and regex_ok:
+            # Provável literal de regex: copia até a barra de fechamento
+            j = i + 1
+            in_class = False
+            while j < n and text[j] != "\n":
+                ch = text[j]
+                if ch == "\\":
+                    j += 1
+                elif ch == "[":
+                    in_class = True
+                elif ch == "]":
+                    in_class = False
+                elif ch == "/" and not in_class:
+                    break
+                j += 1
+            if j < n and text[j] == "/":
+                out.append(text[i:j + 1])
+                last_sig = "/"
+                i = j + 1
+                continue
+        if c.isalnum() or c in "_$":
+            j = i + 1
+            while j < n and (text[j].isalnum() or text[j] in "_$"):
+                j += 1
+            last_word = text[i:j]
+            last_sig = "w"
+            out.append(last_word)
+            i = j
+            continue
+        out.append(c)
+        if c == "\n":
+            line_no += 1
+        elif not c.isspace():
+            last_sig = c
+        i += 1
+    result = "".join(out)
+    if not touched:
+        return result
+    out = []
+    for idx, line in enumerate(result.split("\n")):
+        if idx in touched:
+            line = line.rstrip()
+            if not line:
+                continue
+        out.append(line)
+    return "\n".join(out)
+
+
+def compact_text(text, ext, options):
+    # Aplica as etapas de compactação habilitadas em options
+    if options.get("license"):
+        text = strip_license_banner(text, ext)
+    if options.get("comments") and ext in STRIP_COMMENT_EXTS:
+        if ext == ".py":
+            text = strip_python_comments(text)
+        else:
+            text = strip_c_comments(text, line_comments=ext in LINE_COMMENT_EXTS)
+    if options.get("trailing"):
+        text = strip_trailing_whitespace(text)
+    if options.get("blank"):
+        text = collapse_blank_runs(text)
+    return text
+
+
+# =============================================================================
+# Orçamento de saída
+# =============================================================================
+def estimate_tokens(n_chars):
+    # Heurística rápida: ~4 caracteres por token
+    return (n_chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def file_block_header(path):
+    return "\n" + "=" * 80 + "\n" + f" ARQUIVO: {path}\n" + "=" * 80 + "\n"
+
+
+def plan_budget(entries, budget_chars, policy="selection", priority_exts=()):
+    # entries: lista de (path, tamanho_em_bytes, ...) na ordem de seleção.
+    # O tamanho em bytes é limite superior do número de caracteres após a
+    # decodificação, então o que for admitido aqui nunca estoura o orçamento.
+    # Retorna (admitidos na ordem original, omitidos na ordem de avaliação).
+    order = list(range(len(entries)))
+    if policy == "smallest":
+        order.sort(key=lambda i: entries[i][1])
+    elif policy == "ext_priority":
+        rank = {e: n for n, e in enumerate(priority_exts)}
+        last = len(rank)
+        order.sort(key=lambda i: rank.get(os.path.splitext(entries[i][0])[1].lower(), last))
+
+    remaining = budget_chars
+    admitted = set()
+    omitted = []
+    for i in order:
+        path, size = entries[i][0], entries[i][1]
+        cost = len(file_block_header(path)) + 1 + size
+        if cost <= remaining:
+            admitted.add(i)
+            remaining -= cost
+        else:
+            omitted.append(entries[i])
+    return [entries[i] for i in sorted(admitted)], omitted
+
+
+# =============================================================================
+# Saída em partes
+# =============================================================================
+def split_compress_ext(path):
+    # "saida.txt.gz" -> ("saida.txt", ".gz"); sem compressão -> (path, "")
+    base, ext = os.path.splitext(path)
+    if ext.lower() in COMPRESS_EXTS:
+        return base, ext.lower()
+    return path, ""
+
+
+class OutputFile:
+    # Arquivo de saída em texto UTF-8. Destinos .gz/.xz passam pelos
+    # compressores da stdlib em fluxo, pedaço a pedaço.
+    def __init__(self, path, level=DEFAULT_COMPRESS_LEVEL):
+        self.path = path
+        self.compression = split_compress_ext(path)[1]
+        if self.compression == ".gz":
+            self.raw = gzip.open(path, "wb", compresslevel=min(9, max(1, level)))
+        elif self.compression == ".xz":
+            self.raw = lzma.open(path, "wb", preset=min(9, max(0, level)))
+        else:
+            self.raw = open(path, "wb")
+        self.f = io.TextIOWrapper(self.raw, encoding="utf-8")
+        self.raw_bytes = 0
+
+    def write(self, text):
+        self.f.write(text)
+
+    def close(self):
+        # Retorna o total de bytes não comprimidos gravados
+        if self.f is None:
+            return self.raw_bytes
+        try:
+            self.f.flush()
+            self.raw_bytes = self.raw.tell()
+        finally:
+            self.f.close()
+            self.f = None
+        return self.raw_bytes
+
+
+class PartWriter:
+    # Grava a saída em name.partNN.ext à medida que as partes enchem.
+    # Blocos de arquivo inteiros vão para a próxima parte quando não cabem; só
+    # são quebrados (com marcadores de continuação) se maiores que uma parte.
+    def __init__(self, base_path, max_chars, level=DEFAULT_COMPRESS_LEVEL):
+        base_path, self.compression = split_compress_ext(base_path)
+        root, ext = os.path.splitext(base_path)
+        self.root = root
+        self.ext = ext or ".txt"
+        self.level = level
+        self.max_chars = max(MIN_PART_CHARS, max_chars)
+        self.index = 0
+        self.used = 0
+        self.f = None
+        self.raw_bytes = 0
+        self.manifest = []  # [(caminho_da_parte, [labels])]
+
+    def part_path(self, index):
+        return f"{self.root}.part{index:02d}{self.ext}{self.compression}"
+
+    def manifest_path(self):
+        return f"{self.root}.manifest{self.ext}"
+
+    def _open_next(self):
+        self._close_current()
+        self.index += 1
+        path = self.part_path(self.index)
+        self.f = OutputFile(path, self.level)
+        self.used = 0
+        self.manifest.append((path, []))
+
+    def _close_current(self):
+        if self.f is not None:
+            self.raw_bytes += self.f.close()
+            self.f = None
+
+    def _emit(self, text, label):
+        if self.f is None:
+            self._open_next()
+        self.f.write(text)
+        self.used += len(text)
+        labels = self.manifest[-1][1]
+        if not labels or labels[-1] != label:
+            labels.append(label)
+
+    def write(self, chunk, label=None):
+        label = label or "TEXTO DO USUÁRIO + FILE TREE"
+        if self.f is None:
+            self._open_next()
+        # Após uma quebra, a parte nova só tem o marcador de continuação: o
+        # resto do bloco fica nela em vez de pular para outra parte
+        continued = False
+        while chunk:
+            room = self.max_chars - self.used
+            if len(chunk) <= room:
+                self._emit(chunk, label)
+                return
+            if self.used > 0 and not continued and len(chunk) <= self.max_chars:
+                self._open_next()
+                continue
+            if room < MIN_PART_CHARS // 2:
+                self._open_next()
+                room = self.max_chars
+            end_marker = f"\n[... continua na parte {self.index + 1:02d} ...]\n"
+            room -= len(end_marker)
+            cut = chunk.rfind("\n", 0, room) + 1
+            if cut <= 0:
+                cut = room
+            self._emit(chunk[:cut] + end_marker, label)
+            self._open_next()
+            start_marker = f"[... continuação de {label} ...]\n"
+            self._emit(start_marker, label)
+            continued = True
+            chunk = chunk[cut:]
+
+    def close(self):
+        self._close_current()
+        with open(self.manifest_path(), "w", encoding="utf-8") as f:
+            f.write(f"Partes: {len(self.manifest)} | Máx. por parte: {self.max_chars} caracteres\n")
+            for path, labels in self.manifest:
+                f.write(f"\n{os.path.basename(path)}\n")
+                for label in labels:
+                    f.write(f"  {label}\n")
+        return [path for path, _ in self.manifest]
+
+
+# =============================================================================
+# Observação de mudanças no disco
+# =============================================================================
+# Os observadores chamam on_change(eventos) a partir de uma thread própria, com
+# eventos (tipo, handle, nome):
+#   ("dir", h, nome|None)  -> listagem do diretório h mudou (nome = entrada afetada)
+#   ("file", h, nome|None) -> conteúdo mudou (h é o arquivo, ou o diretório + nome)
+#   ("overflow", None, None) -> eventos perdidos; invalidar tudo
+class InotifyWatcher:
+    # Linux: inotify via ctypes, um watch por diretório
+    def __init__(self, on_change):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add = libc.inotify_add_watch
+        self._add.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._rm = libc.inotify_rm_watch
+        self._rm.argtypes = (ctypes.c_int, ctypes.c_int)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falhou")
+        self.on_change = on_change
+        self.lock = threading.Lock()
+        self.path_wd = {}
+        self.wd_path = {}
+        self.wd_dir = {}    # wd -> handle do diretório observado
+        self.wd_files = {}  # wd -> {nome: handle} de arquivos observados nesse diretório
+        self.running = False
+
+    def _watch_path(self, path):
+        wd = self.path_wd.get(path)
+        if wd is not None:
+            return wd
+        if len(self.path_wd) >= WATCH_LIMIT:
+            return None
+        wd = self._add(self.fd, os.fsencode(path), IN_WATCH_MASK)
+        if wd < 0:
+            return None
+        self.path_wd[path] = wd
+        self.wd_path[wd] = path
+        return wd
+
+    def watch_dir(self, h, path):
+        with self.lock:
+            wd = self._watch_path(path)
+            if wd is None:
+                return False
+            self.wd_dir[wd] = h
+            return True
+
+    def watch_file(self, h, path):
+        parent, name = os.path.split(path)
+        with self.lock:
+            wd = self._watch_path(parent)
+            if wd is None:
+                return False
+            self.wd_files.setdefault(wd, {})[name] = h
+            return True
+
+    def _drop(self, wd):
+        path = self.wd_path.pop(wd, None)
+        self.path_wd.pop(path, None)
+        self.wd_dir.pop(wd, None)
+        self.wd_files.pop(wd, None)
+
+    def unwatch_under(self, prefix):
+        with self.lock:
+            for path, wd in list(self.path_wd.items()):
+                if path == prefix or path.startswith(prefix.rstrip(os.sep) + os.sep):
+                    self._rm(self.fd, wd)
+                    self._drop(wd)
+
+    def clear(self):
+        with self.lock:
+            for wd in list(self.wd_path):
+                self._rm(self.fd, wd)
+                self._drop(wd)
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def _run(self):
+        header = struct.Struct("iIII")
+        while self.running:
+            try:
+                ready, _, _ = select.select([self.fd], [], [], 0.5)
+                if not ready:
+                    continue
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            except OSError:
+                break
+            events = []
+            pos = 0
+            with self.lock:
+                while pos + header.size <= len(data):
+                    wd, mask, _cookie, length = header.unpack_from(data, pos)
+                    raw = data[pos + header.size:pos + header.size + length]
+                    pos += header.size + length
+                    name = os.fsdecode(raw.rstrip(b"\0")) or None
+                    self._translate(wd, mask, name, events)
+            if events:
+                self.on_change(events)
+        os.close(self.fd)
+
+    def _translate(self, wd, mask, name, events):
+        if mask & IN_Q_OVERFLOW:
+            events.append(("overflow", None, None))
+            return
+        d = self.wd_dir.get(wd)
+        files = self.wd_files.get(wd) or {}
+        if mask & IN_IGNORED:
+            self._drop(wd)
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            if d is not None:
+                events.append(("dir", d, None))
+            return
+        if name in files:
+            events.append(("file", files[name], None))
+        if mask & IN_LISTING_MASK:
+            if d is not None:
+                events.append(("dir", d, name))
+        elif d is not None and name not in files:
+            events.append(("file", d, name))
+
+
+class PollingWatcher:
+    # Alternativa portátil: compara mtime de diretórios e (tamanho, mtime) de arquivos
+    def __init__(self, on_change, interval=POLL_INTERVAL_S):
+        self.on_change = on_change
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.dirs = {}   # handle -> (path, mtime_ns)
+        self.files = {}  # handle -> (path, (size, mtime_ns))
+        self.running = False
+
+    @staticmethod
+    def _stat(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def watch_dir(self, h, path):
+        with self.lock:
+            if h in self.dirs:
+                return True
+            if len(self.dirs) + len(self.files) >= POLL_WATCH_LIMIT:
+                return False
+            st = self._stat(path)
+            if st is None:
+                return False
+            self.dirs[h] = (path, st[1])
+            return True
+
+    def watch_file(self, h, path):
+        with self.lock:
+            if h in self.files:
+                return True
+            if len(self.dirs) + len(self.files) >= POLL_WATCH_LIMIT:
+                return False
+            self.files[h] = (path, self._stat(path))
+            return True
+
+    def unwatch_under(self, prefix):
+        prefix = prefix.rstrip(os.sep)
+        with self.lock:
+            for table in (self.dirs, self.files):
+                for h, (path, _) in list(table.items()):
+                    if path == prefix or path.startswith(prefix + os.sep):
+                        del table[h]
+
+    def clear(self):
+        with self.lock:
+            self.dirs.clear()
+            self.files.clear()
+
+    def start(self):
+        self.running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.interval)
+            with self.lock:
+                dirs = list(self.dirs.items())
+                files = list(self.files.items())
+            events = []
+            for h, (path, mtime) in dirs:
+                st = self._stat(path)
+                if st is None or st[1] != mtime:
+                    events.append(("dir", h, None))
+                    with self.lock:
+                        if st is None:
+                            self.dirs.pop(h, None)
+                        elif h in self.dirs:
+                            self.dirs[h] = (path, st[1])
+            for h, (path, old) in files:
+                st = self._stat(path)
+                if st != old:
+                    events.append(("file", h, None))
+                    with self.lock:
+                        if h in self.files:
+                            self.files[h] = (path, st)
+            if events:
+                self.on_change(events)
+
+
+def create_watcher(on_change):
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(on_change)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(on_change)
+
+
+# =============================================================================
+# Leitura de arquivos
+# =============================================================================
+# Funções de módulo para poderem rodar em processos de trabalho.
+# encodings: (alternativas, ((ext, codec), ...)) — hashable para o cache.
+DEFAULT_ENCODINGS = (tuple(DEFAULT_FALLBACK_ENCODINGS.split(",")), ())
+
+# Decisão por arquivo: path -> ((tamanho, mtime_ns), encodings, codec, status)
+ENCODING_CACHE = {}
+
+
+def guess_utf16(sample):
+    # UTF-16 sem BOM: texto ASCII deixa NULs em posições alternadas
+    n = len(sample) // 2 * 2
+    if n < 8:
+        return None
+    half = n // 2
+    even = sample[0:n:2].count(0)
+    odd = sample[1:n:2].count(0)
+    if odd > half * 0.3 and even < half * 0.02:
+        return "utf-16-le"
+    if even > half * 0.3 and odd < half * 0.02:
+        return "utf-16-be"
+    return None
+
+
+def detect_encoding(data, ext, encodings):
+    # (codec, None) ou (None, status de binário). Ordem: override por extensão,
+    # BOM, UTF-16 sem BOM, UTF-8 estrito numa amostra, alternativas.
+    fallbacks, overrides = encodings
+    for e, codec in overrides:
+        if e == ext:
+            return codec, None
+    for bom, codec in BOMS:
+        if data.startswith(bom):
+            return codec, None
+    sample = data[:ENCODING_SAMPLE_BYTES]
+    codec = guess_utf16(sample)
+    if codec:
+        return codec, None
+    if b"\x00" in data:
+        return None, "binary_nul"
+    try:
+        # A amostra pode cortar um caractere multibyte no fim
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=len(sample) == len(data))
+        return "utf-8", None
+    except UnicodeDecodeError:
+        pass
+    if len(sample.translate(None, TEXT_BYTES)) > len(sample) * BINARY_CONTROL_RATIO:
+        return None, "binary_ratio"
+    for codec in fallbacks:
+        try:
+            sample.decode(codec)
+            return codec, None
+        except (UnicodeDecodeError, LookupError):
+            continue
+    # Sem alternativa válida: UTF-8 com substituição e a razão decide
+    return "utf-8", None
+
+
+def read_text_file(path, max_bytes, encodings=DEFAULT_ENCODINGS, st=None):
+    # st: stat já feito por quem chama (evita repetir a chamada por arquivo)
+    if st is None:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None, "not_found"
+        except PermissionError:
+            return None, "no_perm"
+        except Exception:
+            return None, "stat_error"
+
+    if st.st_size > max_bytes:
+        return None, "too_large"
+
+    key = (st.st_size, st.st_mtime_ns)
+    cached = ENCODING_CACHE.get(path)
+    if cached is not None and cached[0] == key and cached[1] == encodings:
+        codec, status = cached[2], cached[3]
+        if status is not None:
+            return None, status  # binário já conhecido: nem abre
+    else:
+        codec = status = None
+
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except Exception:
+        return None, "read_error"
+
+    if codec is None:
+        codec, status = detect_encoding(data, os.path.splitext(path)[1].lower(), encodings)
+        if len(ENCODING_CACHE) >= ENCODING_CACHE_MAX:
+            ENCODING_CACHE.clear()
+        ENCODING_CACHE[path] = (key, encodings, codec, status)
+        if status is not None:
+            return None, status
+
+    try:
+        text = data.decode(codec, errors="replace")
+    except Exception:
+        return None, "decode_error"
+
+    rep = text.count(REPLACEMENT_CHAR)
+    ratio = rep / max(1, len(text))
+    if rep > REPLACEMENT_ABS_THRESHOLD and ratio > REPLACEMENT_RATIO_THRESHOLD:
+        return None, "binary_ratio"
+
+    return text, "ok"
+
+
+def normalize_newlines(s):
+    if s is None:
+        return ""
+    s = s.replace("\r\n", "\n").replace("\r", "\n")
+    return s
+
+
+def read_batch(jobs, max_bytes, encodings, decisions):
+    # Executado num processo de trabalho: lê, classifica e normaliza um lote
+    # de (path, stat | None), devolvendo [(corpo normalizado | None, status)]
+    # na mesma ordem e as decisões de codificação, que o processo principal
+    # guarda no seu cache
+    ENCODING_CACHE.update(decisions)
+    out = []
+    for path, st in jobs:
+        text, status = read_text_file(path, max_bytes, encodings, st)
+        out.append((normalize_newlines(text) if status == "ok" else None, status))
+    return out, {p: ENCODING_CACHE[p] for p, _ in jobs if p in ENCODING_CACHE}
+
+
+def make_batches(jobs, sizes, max_files=MP_BATCH_FILES):
+    # Agrupa arquivos pequenos por tarefa para amortizar o custo de IPC
+    batches = []
+    batch = []
+    batch_bytes = 0
+    for path, size in zip(jobs, sizes):
+        if batch and (len(batch) >= max_files or batch_bytes + size > MP_BATCH_BYTES):
+            batches.append(batch)
+            batch = []
+            batch_bytes = 0
+        batch.append(path)
+        batch_bytes += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+# =============================================================================
+# Pré-leitura em segundo plano
+# =============================================================================
+class Prefetcher:
+    # Lê e classifica arquivos em uma thread de baixa prioridade assim que entram
+    # na lista. Textos ficam num cache LRU limitado por tamanho; o status
+    # (ok/binário/grande...) é guardado para todos. Entradas valem enquanto
+    # (tamanho, mtime_ns) do arquivo não mudar.
+    def __init__(self, reader, on_status, cache_bytes=PREFETCH_CACHE_BYTES):
+        self.reader = reader
+        self.on_status = on_status
+        self.cache_bytes = cache_bytes
+        self.lock = threading.Lock()
+        self.jobs = queue.Queue()
+        self.texts = OrderedDict()  # handle -> texto
+        self.used = 0
+        self.status = {}  # handle -> (tamanho, mtime_ns, status)
+        self.epoch = 0
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, h, path, max_bytes):
+        self.jobs.put((self.epoch, h, path, max_bytes))
+
+    def _run(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), PREFETCH_NICE)
+        except (AttributeError, OSError):
+            pass
+        while True:
+            epoch, h, path, max_bytes = self.jobs.get()
+            if epoch != self.epoch:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+            text, status = self.reader(path, max_bytes)
+            with self.lock:
+                if epoch != self.epoch:
+                    continue
+                self._drop_text(h)
+                if st is not None:
+                    self.status[h] = (st.st_size, st.st_mtime_ns, status)
+                    if status == "ok" and len(text) <= self.cache_bytes // 4:
+                        self.texts[h] = text
+                        self.used += len(text)
+                        while self.used > self.cache_bytes:
+                            _, old = self.texts.popitem(last=False)
+                            self.used -= len(old)
+                else:
+                    self.status.pop(h, None)
+            self.on_status(h, status)
+
+    def _drop_text(self, h):
+        old = self.texts.pop(h, None)
+        if old is not None:
+            self.used -= len(old)
+
+    def get(self, h, st, max_bytes):
+        # (texto, status) se a entrada ainda vale para este stat, senão None
+        with self.lock:
+            entry = self.status.get(h)
+            if entry is None or st is None or entry[:2] != (st.st_size, st.st_mtime_ns):
+                return None
+            status = entry[2]
+            if st.st_size > max_bytes:
+                return None, "too_large"
+            if status == "too_large":
+                return None  # o limite aumentou desde a pré-leitura
+            if status != "ok":
+                return None, status
+            text = self.texts.get(h)
+            if text is None:
+                return None
+            self.texts.move_to_end(h)
+            return text, "ok"
+
+    def status_of(self, h):
+        entry = self.status.get(h)
+        return entry[2] if entry else None
+
+    def invalidate(self, h):
+        with self.lock:
+            self._drop_text(h)
+            self.status.pop(h, None)
+
+    def clear(self):
+        with self.lock:
+            self.epoch += 1
+            self.texts.clear()
+            self.used = 0
+            self.status.clear()
+
+
+# =============================================================================
+# Busca fuzzy de arquivos
+# =============================================================================
+class PathIndex:
+    # Índice de caminhos (handle -> chave em minúsculas) para busca por
+    # subsequência. As chaves são concatenadas num único texto, ordenadas por
+    # tamanho, e a varredura roda no motor de regex; o texto só é remontado
+    # após mudanças.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.keys = {}
+        self._snap = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, h, key):
+        key = key.lower()
+        with self.lock:
+            if self.keys.get(h) != key:
+                self.keys[h] = key
+                self._snap = None
+
+    def discard(self, h):
+        with self.lock:
+            if self.keys.pop(h, None) is not None:
+                self._snap = None
+
+    def discard_where(self, pred):
+        # O predicado roda fora do lock para não travar buscas concorrentes
+        gone = [h for h in self.handles() if pred(h)]
+        with self.lock:
+            for h in gone:
+                self.keys.pop(h, None)
+            if gone:
+                self._snap = None
+
+    def handles(self):
+        with self.lock:
+            return list(self.keys)
+
+    def clear(self):
+        with self.lock:
+            self.keys = {}
+            self._snap = None
+
+    def _snapshot(self):
+        # (handles, chaves, texto, inícios). Cada chave vem precedida de "\n"
+        # e as mais curtas vêm primeiro: dentro de uma faixa, caminho curto vence
+        with self.lock:
+            if self._snap is None:
+                items = sorted(self.keys.items(), key=lambda kv: len(kv[1]))
+                handles = array("i", (h for h, _ in items))
+                keys = [k for _, k in items]
+                starts = array("q")
+                pos = 0
+                for k in keys:
+                    starts.append(pos)
+                    pos += len(k) + 1
+                self._snap = (handles, keys, "\n" + "\n".join(keys), starts)
+            return self._snap
+
+    @staticmethod
+    def _collect(pattern, blob, starts, limit, found, seen):
+        # Acrescenta a found as linhas casadas por pattern, na ordem do texto
+        # (da chave mais curta para a mais longa), até somar limit linhas
+        for m in pattern.finditer(blob):
+            if len(found) >= limit:
+                return
+            i = bisect.bisect_right(starts, m.start()) - 1
+            if i not in seen:
+                seen.add(i)
+                found.append(i)
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        # Ranking em faixas, da melhor para a pior, cada uma uma regex:
+        #   1. nome do arquivo começa com a consulta
+        #   2. nome do arquivo contém a consulta
+        #   3. caminho contém a consulta
+        #   4. caminho contém a consulta como subsequência
+        # Linhas já casadas numa faixa não se repetem nas seguintes. Como o
+        # texto está ordenado por tamanho, cada faixa já sai ordenada (caminho
+        # curto primeiro) e a varredura para ao completar limit resultados.
+        q = "".join(query.lower().split())
+        if not q:
+            return []
+        handles, keys, blob, starts = self._snapshot()
+        e = re.escape(q)
+        tiers = []
+        if q in blob:
+            if "/" not in q:
+                # O literal vem primeiro para o motor saltar direto às ocorrências
+                tiers.append("%s(?<=/%s)[^/\n]*$" % (e, e))
+                tiers.append(e + "[^/\n]*$")
+            tiers.append(e)
+        if len(q) > 1:
+            # "[^\nc]*c" avança até a primeira ocorrência de cada caractere,
+            # sem retrocesso; o resto da linha é consumido para casar uma vez
+            tiers.append(re.escape(q[0]) + "".join("[^\n%s]*%s" % (re.escape(c), re.escape(c)) for c in q[1:]) + "[^\n]*")
+        found = []
+        seen = set()
+        for pattern in tiers:
+            if len(found) >= limit:
+                break
+            self._collect(re.compile(pattern, re.M), blob, starts, limit, found, seen)
+        return [handles[i] for i in found]
+
+
+# =============================================================================
+# Resumo de pastas no FILE TREE
+# =============================================================================
+def summary_entry(e, rel, skip, follow, chain):
+    # (relpath, is_dir, identidade | None) de uma entrada de scandir, ou None
+    # se o tree a omitiria. Nomes em normcase, como na PathTable.
+    name = os.path.normcase(e.name)
+    e_rel = rel + "/" + name if rel else name
+    ident = None
+    if follow is not None and e.is_symlink():
+        target = follow(e.path, chain)
+        if target is None:
+            return None
+        is_dir, ident = target
+    else:
+        is_dir = e.is_dir(follow_symlinks=False)
+        if is_dir and follow is not None:
+            st = e.stat(follow_symlinks=False)
+            ident = (st.st_dev, st.st_ino)
+    if skip is not None and skip(e_rel, name, is_dir):
+        return None
+    return e_rel, is_dir, ident
+
+
+def summarize_dir(path, rel="", skip=None, follow=None, chain=frozenset()):
+    # (arquivos, bytes) da subárvore numa varredura só com scandir, sem criar
+    # handles nem observar diretórios. Filtros opcionais, os mesmos do tree:
+    #   skip(relpath, nome, is_dir) -> bool; rel é o caminho de path na raiz
+    #   follow(caminho_do_link, chain) -> (is_dir, identidade) do alvo, ou
+    #   None para omitir o link; sem follow, links não são seguidos
+    #   chain: identidades (st_dev, st_ino) das pastas de path até a raiz
+    files = 0
+    total = 0
+    stack = [(path, rel, chain)]
+    while stack:
+        d, d_rel, d_chain = stack.pop()
+        try:
+            with os.scandir(d) as it:
+                for e in it:
+                    try:
+                        entry = summary_entry(e, d_rel, skip, follow, d_chain)
+                        if entry is None:
+                            continue
+                        e_rel, is_dir, ident = entry
+                        if is_dir:
+                            stack.append((e.path, e_rel, d_chain | {ident} if ident else d_chain))
+                        else:
+                            files += 1
+                            total += e.stat().st_size
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return files, total
+
+
+def count_dir_entries(path, rel="", skip=None, follow=None, chain=frozenset()):
+    # Entradas visíveis de path, com os mesmos filtros de summarize_dir
+    n = 0
+    try:
+        with os.scandir(path) as it:
+            for e in it:
+                try:
+                    if summary_entry(e, rel, skip, follow, chain) is not None:
+                        n += 1
+                except OSError:
+                    continue
+    except OSError:
+        return 0
+    return n
+
+
+def fmt_count(n):
+    return f"{n:,}".replace(",", ".")
+
+
+def match_collapse_rule(name, relpath, rules):
+    # Regra casa com o nome da pasta ("fixtures") ou com o caminho relativo à raiz ("tests/data*")
+    for rule in rules:
+        if fnmatch.fnmatch(name, rule) or fnmatch.fnmatch(relpath, rule):
+            return True
+    return False
+
+
+# =============================================================================
+# Seleção por conteúdo
+# =============================================================================
+class ContentMatcher:
+    # Padrão de busca por conteúdo. Primeiro tenta os bytes do arquivo mapeado
+    # (padrão codificado em UTF-8); se não casar e o resultado puder depender
+    # da codificação (padrão não ASCII, NULs de UTF-16/32 ou regex sobre
+    # bytes não ASCII), repete sobre o texto decodificado, onde IGNORECASE
+    # dobra também acentos. Só guarda
+    # padrões compilados, então pode ser enviado a processos de trabalho.
+    # Regex inválida levanta re.error.
+    def __init__(self, pattern, is_regex, ignore_case):
+        flags = re.IGNORECASE if ignore_case else 0
+        self.text_rx = re.compile(pattern if is_regex else re.escape(pattern), flags)
+        self.is_ascii = all(ord(c) < 128 for c in pattern)
+        self.is_regex = is_regex
+        raw = pattern.encode("utf-8")
+        self.raw = None
+        self.bytes_rx = None
+        if not is_regex and not ignore_case:
+            self.raw = raw
+        elif not is_regex:
+            self.bytes_rx = re.compile(re.escape(raw), flags)
+        elif self.is_ascii:
+            # Classes de regex não ASCII não têm equivalente em bytes
+            self.bytes_rx = re.compile(raw, flags)
+
+    def match_bytes(self, buf):
+        if self.raw is not None:
+            return buf.find(self.raw) != -1
+        return self.bytes_rx is not None and self.bytes_rx.search(buf) is not None
+
+    def needs_text(self, buf):
+        if not self.is_ascii or b"\x00" in buf[:ENCODING_SAMPLE_BYTES]:
+            return True
+        # "." e classes casam um byte, não um caractere multibyte
+        return self.is_regex and re.search(rb"[\x80-\xff]", buf) is not None
+
+    def match_text(self, text):
+        return self.text_rx.search(text) is not None
+
+
+def file_contains(path, matcher, max_bytes, encodings=DEFAULT_ENCODINGS):
+    # Varre o arquivo mapeado em memória; a busca para na primeira ocorrência.
+    # Vazios, maiores que o limite ou ilegíveis contam como sem ocorrência.
+    try:
+        size = os.stat(path).st_size
+    except OSError:
+        return False
+    if size == 0 or size > max_bytes:
+        return False
+    try:
+        with open(path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if matcher.match_bytes(mm):
+                    return True
+                if not matcher.needs_text(mm):
+                    return False
+    except (OSError, ValueError):
+        return False
+    text, status = read_text_file(path, max_bytes, encodings)
+    return status == "ok" and matcher.match_text(text)
+
+
+def grep_batch(paths, matcher, max_bytes, encodings, decisions):
+    # Executado num processo de trabalho, como read_batch: devolve
+    # [casou?] na mesma ordem e as decisões de codificação tomadas
+    ENCODING_CACHE.update(decisions)
+    out = [file_contains(path, matcher, max_bytes, encodings) for path in paths]
+    return out, {p: ENCODING_CACHE[p] for p in paths if p in ENCODING_CACHE}
+
+
 class App(tk.Tk):
     def __init__(self):
         tk.Tk.__init__(self)
@@ -158,18 +1494,54 @@ class App(tk.Tk):
         self.geometry("1200x700")
         self.minsize(1000, 600)
 
+        # Caminhos são handles da PathTable; strings só na saída/exibição
+        self.paths = PathTable()
         self.roots = []
         self.removed_paths = set()
         self.node_path = {}
-        self.node_is_dir = {}
+        self.node_of = {}
         self.populated_nodes = set()
-        self.selected_files = []
-        self.selected_files_set = set()
-        self.last_output = None
+        self.selected_files = array("i")
+        # Impressões digitais da última geração: handle -> (tamanho, mtime_ns, hash)
+        self.fingerprints = None
+        self.last_tree_digest = None
         self.gitignores = {}
+        self.file_sizes = {}
+        self.est_bytes = 0
+        self.est_count = 0
+        # Min-heap (tamanho, handle) dos maiores arquivos, mantido incrementalmente
+        self.est_top = []
+        self.est_filters = None
+        self._est_after_id = None
+        # Enquanto um projeto aberto é validado, a estimativa espera os tamanhos
+        self.project_checking = False
+        # Listagens cruas de diretórios observados; invalidadas pelo watcher.
+        # Threads de varredura e a UI usam o cache: todo acesso passa pelo lock
+        self.dir_cache = {}
+        self.dir_cache_epoch = 0
+        self.dir_cache_lock = threading.Lock()
+        self.symlink_policy = SYMLINK_POLICIES[DEFAULT_SYMLINK_POLICY]
+        # Lidas por threads de leitura; atualizadas a partir da UI
+        self.encoding_options = DEFAULT_ENCODINGS
+        self._enc_after_id = None
+        # Índice de busca montado em segundo plano; montagens iniciadas antes
+        # de um "Limpar tudo" são descartadas pela session_epoch
+        self.search_index = PathIndex()
+        self.search_hits = []
+        self.search_jobs = 0
+        self.search_pending = []
+        self._search_after_id = None
+        # Incrementada a cada "Limpar tudo"/abertura de projeto; descarta
+        # validações e varreduras em segundo plano de uma sessão anterior
+        self.session_epoch = 0
 
         self.log_queue = queue.Queue()
         self.result_queue = queue.Queue()
+        self.fs_queue = queue.Queue()
+        self.watcher = create_watcher(self.fs_queue.put)
+        self.watcher.start()
+        self.status_queue = queue.Queue()
+        self.prefetcher = Prefetcher(self._read_text_file, lambda h, status: self.status_queue.put((h, status)))
 
         self._build_ui()
         self.after(100, self._process_queues)
@@ -193,9 +1565,36 @@ class App(tk.Tk):
         self.btn_remove_selected = ttk.Button(left_buttons, text="Remover selecionados", command=self._on_remove_selected_nodes)
         self.btn_remove_selected.pack(side="left")
 
+        self.btn_save_project = ttk.Button(left_buttons, text="Salvar projeto…", command=self._on_save_project)
+        self.btn_save_project.pack(side="right")
+
+        self.btn_open_project = ttk.Button(left_buttons, text="Abrir projeto…", command=self._on_open_project)
+        self.btn_open_project.pack(side="right", padx=6)
+
         # Menu de contexto do tree
         self.tree_menu = tk.Menu(self, tearoff=0)
 
+        search_frame = ttk.Frame(left_frame)
+        search_frame.pack(fill="x", padx=6, pady=(0, 3))
+
+        search_top = ttk.Frame(search_frame)
+        search_top.pack(fill="x")
+        ttk.Label(search_top, text="Buscar:").pack(side="left")
+        self.entry_search = ttk.Entry(search_top)
+        self.entry_search.pack(side="left", fill="x", expand=True, padx=6)
+        self.entry_search.bind("<KeyRelease>", lambda e: self._schedule_search())
+        self.search_label = ttk.Label(search_top, text="", foreground="gray")
+        self.search_label.pack(side="left")
+
+        self.search_list = tk.Listbox(search_frame, height=6, selectmode="extended", activestyle="none")
+        self.search_list.pack(fill="x", pady=(3, 3))
+        self.search_list.bind("<Double-1>", lambda e: self._on_search_add())
+
+        search_buttons = ttk.Frame(search_frame)
+        search_buttons.pack(fill="x")
+        ttk.Button(search_buttons, text="Adicionar à lista", command=self._on_search_add).pack(side="left", padx=(0, 6))
+        ttk.Button(search_buttons, text="Mostrar no tree", command=self._on_search_reveal).pack(side="left")
+
         tree_frame = ttk.Frame(left_frame)
         tree_frame.pack(fill="both", expand=True, padx=6, pady=(0, 6))
 
@@ -236,6 +1635,72 @@ class App(tk.Tk):
         self.entry_max_mb.insert(0, str(DEFAULT_MAX_MB))
         self.entry_max_mb.pack(side="left")
 
+        enc_frame = ttk.Frame(top_frame)
+        enc_frame.pack(fill="x", pady=(0, 6))
+
+        ttk.Label(enc_frame, text="Codificações alternativas:").pack(side="left")
+        self.entry_encodings = ttk.Entry(enc_frame, width=20)
+        self.entry_encodings.insert(0, DEFAULT_FALLBACK_ENCODINGS)
+        self.entry_encodings.pack(side="left", padx=(6, 0))
+
+        ttk.Label(enc_frame, text="Por extensão (ex.: .txt=cp1252):").pack(side="left", padx=(6, 0))
+        self.entry_encoding_overrides = ttk.Entry(enc_frame)
+        self.entry_encoding_overrides.pack(side="left", fill="x", expand=True, padx=(6, 0))
+
+        compact_frame = ttk.Frame(top_frame)
+        compact_frame.pack(fill="x", pady=(0, 6))
+
+        ttk.Label(compact_frame, text="Compactação:").pack(side="left")
+        self.var_compact_blank = tk.BooleanVar(value=False)
+        self.var_compact_trailing = tk.BooleanVar(value=False)
+        self.var_compact_license = tk.BooleanVar(value=False)
+        self.var_compact_comments = tk.BooleanVar(value=False)
+        ttk.Checkbutton(compact_frame, text="Colapsar linhas em branco", variable=self.var_compact_blank).pack(side="left", padx=(6, 0))
+        ttk.Checkbutton(compact_frame, text="Remover espaços finais", variable=self.var_compact_trailing).pack(side="left", padx=(6, 0))
+        ttk.Checkbutton(compact_frame, text="Remover cabeçalho de licença", variable=self.var_compact_license).pack(side="left", padx=(6, 0))
+        ttk.Checkbutton(compact_frame, text="Remover comentários (.py/.js/.ts/.css)", variable=self.var_compact_comments).pack(side="left", padx=(6, 0))
+
+        budget_frame = ttk.Frame(top_frame)
+        budget_frame.pack(fill="x", pady=(0, 6))
+
+        ttk.Label(budget_frame, text="Orçamento — máx. caracteres:").pack(side="left")
+        self.entry_budget_chars = ttk.Entry(budget_frame, width=10)
+        self.entry_budget_chars.pack(side="left", padx=(6, 0))
+
+        ttk.Label(budget_frame, text="máx. tokens (aprox.):").pack(side="left", padx=(6, 0))
+        self.entry_budget_tokens = ttk.Entry(budget_frame, width=10)
+        self.entry_budget_tokens.pack(side="left", padx=(6, 0))
+
+        ttk.Label(budget_frame, text="Política:").pack(side="left", padx=(6, 0))
+        self.combo_budget_policy = ttk.Combobox(budget_frame, values=list(BUDGET_POLICIES), state="readonly", width=22)
+        self.combo_budget_policy.set(DEFAULT_BUDGET_POLICY)
+        self.combo_budget_policy.pack(side="left", padx=(6, 0))
+
+        ttk.Label(budget_frame, text="Extensões prioritárias:").pack(side="left", padx=(6, 0))
+        self.entry_priority_exts = ttk.Entry(budget_frame)
+        self.entry_priority_exts.pack(side="left", fill="x", expand=True, padx=(6, 0))
+
+        tree_cfg_frame = ttk.Frame(top_frame)
+        tree_cfg_frame.pack(fill="x", pady=(0, 6))
+
+        ttk.Label(tree_cfg_frame, text="File tree — profundidade máx.:").pack(side="left")
+        self.entry_tree_depth = ttk.Entry(tree_cfg_frame, width=4)
+        self.entry_tree_depth.pack(side="left", padx=(6, 0))
+
+        ttk.Label(tree_cfg_frame, text="máx. itens por pasta:").pack(side="left", padx=(6, 0))
+        self.entry_tree_fanout = ttk.Entry(tree_cfg_frame, width=6)
+        self.entry_tree_fanout.pack(side="left", padx=(6, 0))
+
+        ttk.Label(tree_cfg_frame, text="Resumir pastas:").pack(side="left", padx=(6, 0))
+        self.entry_tree_collapse = ttk.Entry(tree_cfg_frame)
+        self.entry_tree_collapse.pack(side="left", fill="x", expand=True, padx=(6, 0))
+
+        ttk.Label(tree_cfg_frame, text="Links simbólicos:").pack(side="left", padx=(6, 0))
+        self.combo_symlinks = ttk.Combobox(tree_cfg_frame, values=list(SYMLINK_POLICIES), state="readonly", width=14)
+        self.combo_symlinks.set(DEFAULT_SYMLINK_POLICY)
+        self.combo_symlinks.pack(side="left", padx=(6, 0))
+        self.combo_symlinks.bind("<<ComboboxSelected>>", self._on_symlink_policy_changed)
+
         ttk.Label(top_frame, text="Texto do usuário:").pack(anchor="w")
         self.user_text = scrolledtext.ScrolledText(top_frame, wrap="word", height=8)  # reduzido p/ dar espaço aos botões
         self.user_text.pack(fill="both", expand=True)
@@ -255,16 +1720,35 @@ class App(tk.Tk):
         self.btn_clear_list = ttk.Button(mid_buttons, text="Limpar lista", command=self._on_clear_selected_list)
         self.btn_clear_list.pack(side="left", padx=6)
 
-        ttk.Label(mid_frame, text="Arquivos a concatenar:").pack(anchor="w")
+        grep_frame = ttk.Frame(mid_frame)
+        grep_frame.pack(fill="x", pady=(0, 6))
+
+        ttk.Label(grep_frame, text="Conteúdo:").pack(side="left")
+        self.entry_grep = ttk.Entry(grep_frame)
+        self.entry_grep.pack(side="left", fill="x", expand=True, padx=6)
+        self.var_grep_regex = tk.BooleanVar(value=False)
+        self.var_grep_icase = tk.BooleanVar(value=False)
+        ttk.Checkbutton(grep_frame, text="Regex", variable=self.var_grep_regex).pack(side="left")
+        ttk.Checkbutton(grep_frame, text="Ignorar maiúsculas", variable=self.var_grep_icase).pack(side="left", padx=(6, 0))
+        self.btn_add_by_content = ttk.Button(grep_frame, text="Adicionar do tree por conteúdo", command=self._on_add_by_content)
+        self.btn_add_by_content.pack(side="left", padx=(6, 0))
+
+        files_label_frame = ttk.Frame(mid_frame)
+        files_label_frame.pack(fill="x")
+        ttk.Label(files_label_frame, text="Arquivos a concatenar:").pack(side="left")
+        self.estimate_label = ttk.Label(files_label_frame, text="", foreground="gray")
+        self.estimate_label.pack(side="left", fill="x", expand=True, padx=(12, 0))
 
         files_view_frame = ttk.Frame(mid_frame)
         files_view_frame.pack(fill="both", expand=True)
 
-        self.files_view = ttk.Treeview(files_view_frame, columns=("name", "path"), show="headings", selectmode="extended")
+        self.files_view = ttk.Treeview(files_view_frame, columns=("name", "path", "status"), show="headings", selectmode="extended")
         self.files_view.heading("name", text="Nome")
         self.files_view.heading("path", text="Caminho")
+        self.files_view.heading("status", text="Status")
         self.files_view.column("name", width=220, anchor="w")
         self.files_view.column("path", anchor="w")
+        self.files_view.column("status", width=130, anchor="w", stretch=False)
 
         files_vsb = ttk.Scrollbar(files_view_frame, orient="vertical", command=self.files_view.yview)
         files_hsb = ttk.Scrollbar(files_view_frame, orient="horizontal", command=self.files_view.xview)
@@ -292,12 +1776,36 @@ class App(tk.Tk):
         self.btn_save_file = ttk.Button(footer, text="Salvar em arquivo…", command=self._on_save_to_file)
         self.btn_save_file.pack(side="left", padx=6)
 
+        self.var_delta = tk.BooleanVar(value=False)
+        ttk.Checkbutton(footer, text="Só alterações (delta)", variable=self.var_delta).pack(side="left", padx=(6, 0))
+
+        self.var_multiprocess = tk.BooleanVar(value=True)
+        ttk.Checkbutton(footer, text="Processos paralelos", variable=self.var_multiprocess).pack(side="left", padx=(6, 0))
+
+        ttk.Label(footer, text="Partes de até (caracteres):").pack(side="left", padx=(6, 0))
+        self.entry_part_chars = ttk.Entry(footer, width=10)
+        self.entry_part_chars.pack(side="left", padx=(6, 0))
+
+        ttk.Label(footer, text="Nível .gz/.xz:").pack(side="left", padx=(6, 0))
+        self.entry_compress_level = ttk.Entry(footer, width=3)
+        self.entry_compress_level.insert(0, str(DEFAULT_COMPRESS_LEVEL))
+        self.entry_compress_level.pack(side="left", padx=(6, 0))
+
         self.btn_reset_all = ttk.Button(footer, text="Limpar tudo", command=self._on_reset_all)
         self.btn_reset_all.pack(side="left", padx=6)
 
         self.btn_exit = ttk.Button(footer, text="Sair", command=self.destroy)
         self.btn_exit.pack(side="right")
 
+        # Estimativa ao vivo: filtros alterados forçam recálculo a partir do cache
+        self.entry_exts.bind("<KeyRelease>", lambda e: self._schedule_estimate(full=True))
+        self.entry_max_mb.bind("<KeyRelease>", lambda e: self._schedule_estimate(full=True))
+        self.entry_budget_chars.bind("<KeyRelease>", lambda e: self._schedule_estimate())
+        self.entry_budget_tokens.bind("<KeyRelease>", lambda e: self._schedule_estimate())
+        self.user_text.bind("<KeyRelease>", lambda e: self._schedule_estimate())
+        self.entry_encodings.bind("<KeyRelease>", lambda e: self._schedule_encoding_update())
+        self.entry_encoding_overrides.bind("<KeyRelease>", lambda e: self._schedule_encoding_update())
+
         self.user_text.focus_set()
 
     # ---------------------------------------------------------------------
@@ -335,25 +1843,39 @@ class App(tk.Tk):
                     except Exception as e:
                         messagebox.showerror(APP_TITLE, f"Falha ao copiar para a área de transferência: {e}")
                 elif mode == "save_done":
-                    content = payload
-                    file_path = filedialog.asksaveasfilename(
-                        title="Salvar em arquivo",
-                        defaultextension=".txt",
-                        filetypes=[("Texto", "*.txt"), ("Todos os arquivos", "*.*")]
-                    )
-                    if file_path:
-                        try:
-                            with open(file_path, "w", encoding="utf-8") as f:
-                                f.write(content)
-                            self.log(f"Conteúdo salvo em: {file_path}")
-                        except Exception as e:
-                            messagebox.showerror(APP_TITLE, f"Falha ao salvar o arquivo: {e}")
-                    else:
-                        self.log("Salvar cancelado pelo usuário.")
+                    for file_path in payload:
+                        self.log(f"Conteúdo salvo em: {file_path}")
+                elif mode == "save_error":
+                    messagebox.showerror(APP_TITLE, f"Falha ao salvar o arquivo: {payload}")
                 elif mode == "done_cleanup":
                     self._set_busy(False)
+                elif mode == "grep_done":
+                    self._add_grep_hits(payload)
+                elif mode == "project_checked":
+                    self._on_project_checked(payload)
+                elif mode == "index_done":
+                    self.search_jobs -= 1
+                    self._schedule_search()
+        except queue.Empty:
+            pass
+
+        try:
+            while True:
+                h, status = self.status_queue.get_nowait()
+                iid = str(h)
+                if self.files_view.exists(iid):
+                    self.files_view.set(iid, "status", STATUS_LABELS.get(status, status))
+        except queue.Empty:
+            pass
+
+        events = []
+        try:
+            while True:
+                events.extend(self.fs_queue.get_nowait())
         except queue.Empty:
             pass
+        if events:
+            self._apply_fs_events(events)
 
         self.after(100, self._process_queues)
 
@@ -366,41 +1888,52 @@ class App(tk.Tk):
             return
         folder = norm_case_path(folder)
 
-        for root in self.roots:
-            if folder == root or is_subpath(folder, root) or is_subpath(root, folder):
-                self.log("Pasta ignorada por duplicidade ou sobreposição.")
-                return
-
         if not os.path.isdir(folder):
             messagebox.showerror(APP_TITLE, "Caminho inválido.")
             return
 
-        self.roots.append(folder)
-        self._insert_root(folder)
-        self._load_gitignore_for_root(folder)
+        h = self.paths.add(folder, is_dir=True)
+        for root in self.roots:
+            if self.paths.is_within(h, root) or self.paths.is_within(root, h):
+                self.log("Pasta ignorada por duplicidade ou sobreposição.")
+                return
+
+        self.roots.append(h)
+        self._insert_root(h)
+        self._load_gitignore_for_root(h)
+        self._start_search_index(h)
         self.log(f"Pasta adicionada: {folder}")
 
-    def _insert_root(self, root_path):
-        # Mostra apenas o nome da pasta no tree; guarda caminho completo no mapa
+    def _insert_root(self, root):
+        # Mostra apenas o nome da pasta no tree; guarda o handle no mapa
+        root_path = self.paths.path(root)
         base = os.path.basename(root_path.rstrip("\\/")) or root_path
         node_id = self.tree.insert("", "end", text=base, open=False)
-        self.node_path[node_id] = root_path
-        self.node_is_dir[node_id] = True
+        self.node_path[node_id] = root
+        self.node_of[root] = node_id
         self._add_placeholder(node_id)
 
     def _add_placeholder(self, node_id):
         placeholder = self.tree.insert(node_id, "end", text="…")
         self.node_path[placeholder] = None
-        self.node_is_dir[placeholder] = False
+
+    def _node_is_dir(self, node_id):
+        h = self.node_path.get(node_id)
+        return h is not None and self.paths.is_dir(h)
 
     def _on_tree_open(self, event):
         node_id = self.tree.focus()
-        if not node_id:
-            return
+        if node_id:
+            self._populate_node(node_id)
+
+    def _populate_node(self, node_id):
         if node_id in self.populated_nodes:
             return
-        path = self.node_path.get(node_id)
-        if not path or not os.path.isdir(path):
+        h = self.node_path.get(node_id)
+        if h is None:
+            return
+        path = self.paths.path(h)
+        if not os.path.isdir(path):
             return
 
         children = self.tree.get_children(node_id)
@@ -409,18 +1942,7 @@ class App(tk.Tk):
                 self.tree.delete(c)
 
         try:
-            entries = []
-            with os.scandir(path) as it:
-                for e in it:
-                    name = e.name
-                    full = os.path.join(path, name)
-                    try:
-                        is_dir = e.is_dir(follow_symlinks=False)
-                    except Exception:
-                        is_dir = False
-                    if self._should_skip_path(full, is_dir):
-                        continue
-                    entries.append((name, full, is_dir))
+            entries = self._list_dir(h)
         except PermissionError:
             self.log("Acesso negado ao abrir diretório.")
             return
@@ -431,36 +1953,70 @@ class App(tk.Tk):
             self.log(f"Erro ao listar diretório: {e}")
             return
 
-        entries.sort(key=lambda x: (not x[2], x[0].lower()))
-
-        for name, full, is_dir in entries:
-            child_id = self.tree.insert(node_id, "end", text=name, open=False)
-            self.node_path[child_id] = full
-            self.node_is_dir[child_id] = is_dir
-            if is_dir:
-                self._add_placeholder(child_id)
+        for name, child, is_dir in entries:
+            self._insert_child_node(node_id, "end", name, child, is_dir)
 
         self.populated_nodes.add(node_id)
 
+    def _insert_child_node(self, node_id, index, name, child, is_dir):
+        child_id = self.tree.insert(node_id, index, text=name, open=False)
+        self.node_path[child_id] = child
+        self.node_of[child] = child_id
+        if is_dir:
+            self._add_placeholder(child_id)
+        return child_id
+
+    def _refresh_node_children(self, node_id):
+        # Sincroniza os filhos de um nó já populado com o disco, preservando
+        # nós existentes (e suas expansões) e inserindo/removendo só a diferença
+        h = self.node_path.get(node_id)
+        if h is None:
+            return
+        try:
+            entries = self._list_dir(h)
+        except OSError:
+            if self.tree.parent(node_id) != "":
+                self._delete_node_recursive(node_id)
+            return
+        existing = {}
+        for c in self.tree.get_children(node_id):
+            ch = self.node_path.get(c)
+            if ch is not None:
+                existing[ch] = c
+        keep = set()
+        for index, (name, child, is_dir) in enumerate(entries):
+            keep.add(child)
+            child_id = existing.get(child)
+            if child_id is None:
+                self._insert_child_node(node_id, index, name, child, is_dir)
+            else:
+                self.tree.move(child_id, node_id, index)
+        for child, child_id in existing.items():
+            if child not in keep:
+                self._delete_node_recursive(child_id)
+
     def _on_tree_double_click(self, event):
         # Adiciona arquivo ao painel ao dar duplo clique
         item = self.tree.identify_row(event.y)
         if not item:
             return
-        path = self.node_path.get(item)
-        if not path or not os.path.isfile(path):
+        h = self.node_path.get(item)
+        if h is None:
             return
-        if self._is_removed(path):
+        path = self.paths.path(h)
+        if not os.path.isfile(path):
             return
-        if self._is_gitignored(path, is_dir=False):
+        if self._is_removed(h):
+            return
+        if self._is_gitignored(h, is_dir=False):
             return
         allow_exts = self._get_allowed_exts()
-        if not self._ext_allowed(path, allow_exts):
+        if not self._ext_allowed(self.paths.name(h), allow_exts):
             return
-        added = self._add_selected_file(path)
+        added = self._add_selected_file(h)
         if added:
             self._refresh_files_view()
-            self._select_file_in_files_view(path)
+            self._select_file_in_files_view(h)
             self.log(f"Arquivo adicionado: {path}")
 
     def _on_tree_right_click(self, event):
@@ -471,9 +2027,8 @@ class App(tk.Tk):
         self.tree.selection_set(item)
         self.tree.focus(item)
         self.tree_menu.delete(0, "end")
-        path = self.node_path.get(item)
         parent = self.tree.parent(item)
-        is_dir = self.node_is_dir.get(item, False)
+        is_dir = self._node_is_dir(item)
 
         if parent == "":  # raiz
             self.tree_menu.add_command(label="Recarregar pasta", command=lambda i=item: self._reload_node(i))
@@ -492,10 +2047,11 @@ class App(tk.Tk):
 
     def _reload_node(self, node_id):
         # Recarrega o conteúdo de um diretório
-        if not self.node_is_dir.get(node_id, False):
+        if not self._node_is_dir(node_id):
             return
         for c in self.tree.get_children(node_id):
             self._delete_node_recursive(c)
+        self._invalidate_dir_cache(self.node_path[node_id], recursive=True)
         self.populated_nodes.discard(node_id)
         self._add_placeholder(node_id)
         self.tree.item(node_id, open=True)
@@ -503,45 +2059,54 @@ class App(tk.Tk):
         self._on_tree_open(None)
         self.log("Nó recarregado.")
 
-    def _reset_removed_for_root(self, node_id):
-        # Limpa todos os removidos pertencentes à raiz e recarrega
-        root_path = self.node_path.get(node_id)
-        if not root_path:
-            return
+    def _clear_removed_under(self, root):
+        # Remove flags de removidos sob a raiz
         to_keep = set()
         for r in self.removed_paths:
-            if not is_subpath(r, root_path):
+            if self.paths.is_within(r, root):
+                self.paths.set_flag(r, FLAG_REMOVED, False)
+            else:
                 to_keep.add(r)
         self.removed_paths = to_keep
+
+    def _mark_removed(self, h):
+        self.removed_paths.add(h)
+        self.paths.set_flag(h, FLAG_REMOVED)
+
+    def _reset_removed_for_root(self, node_id):
+        # Limpa todos os removidos pertencentes à raiz e recarrega
+        root = self.node_path.get(node_id)
+        if root is None:
+            return
+        self._clear_removed_under(root)
+        self._schedule_estimate(full=True)
         self._reload_node(node_id)
+        self._start_search_index(root)
         self.log("Itens removidos resetados para esta pasta.")
 
     def _remove_root(self, node_id):
         # Remove raiz corretamente permitindo adicioná-la novamente
-        root_path = self.node_path.get(node_id)
-        if not root_path:
+        root = self.node_path.get(node_id)
+        if root is None:
             return
-        try:
-            self.roots = [r for r in self.roots if norm_case_path(r) != norm_case_path(root_path)]
-            self.gitignores.pop(root_path, None)
-        except Exception:
-            pass
-        # Remove flags de removidos sob essa raiz
-        to_keep = set()
-        for r in self.removed_paths:
-            if not is_subpath(r, root_path):
-                to_keep.add(r)
-        self.removed_paths = to_keep
+        self.roots = [r for r in self.roots if r != root]
+        self.gitignores.pop(root, None)
+        self.watcher.unwatch_under(self.paths.path(root))
+        self._invalidate_dir_cache(root, recursive=True)
+        self._clear_removed_under(root)
+        self.search_index.discard_where(lambda h: self.paths.is_within(h, root))
+        self._schedule_estimate(full=True)
         # Remove nó visual
         self._delete_node_recursive(node_id)
-        self.log(f"Pasta removida: {root_path}")
+        self.log(f"Pasta removida: {self.paths.path(root)}")
 
     def _remove_node_only(self, node_id):
         # Remove apenas do tree (marca como removido)
-        path = self.node_path.get(node_id)
-        if not path:
+        h = self.node_path.get(node_id)
+        if h is None:
             return
-        self.removed_paths.add(norm_case_path(path))
+        self._mark_removed(h)
+        self._schedule_estimate(full=True)
         self._delete_node_recursive(node_id)
         self.log("Item removido do tree.")
 
@@ -556,13 +2121,14 @@ class App(tk.Tk):
             if self.tree.parent(node_id) == "":  # raiz
                 roots_ignored += 1
                 continue
-            path = self.node_path.get(node_id)
-            if not path:
+            h = self.node_path.get(node_id)
+            if h is None:
                 continue
-            self.removed_paths.add(norm_case_path(path))
+            self._mark_removed(h)
             self._delete_node_recursive(node_id)
             removed += 1
         if removed > 0:
+            self._schedule_estimate(full=True)
             self.log(f"Removidos do tree: {removed}")
         if roots_ignored > 0:
             self.log("Raízes não removidas aqui. Use o menu de contexto da pasta.")
@@ -570,14 +2136,9 @@ class App(tk.Tk):
     def _delete_node_recursive(self, node_id):
         for child in self.tree.get_children(node_id):
             self._delete_node_recursive(child)
-        try:
-            del self.node_path[node_id]
-        except Exception:
-            pass
-        try:
-            del self.node_is_dir[node_id]
-        except Exception:
-            pass
+        h = self.node_path.pop(node_id, None)
+        if h is not None and self.node_of.get(h) == node_id:
+            del self.node_of[h]
         self.populated_nodes.discard(node_id)
         try:
             self.tree.delete(node_id)
@@ -593,37 +2154,115 @@ class App(tk.Tk):
             return
 
         added = 0
-        last_added_path = None
+        last_added = None
         start = time.time()
         allow_exts = self._get_allowed_exts()
 
         for node_id in sel:
-            path = self.node_path.get(node_id)
-            if not path or self._is_removed(path):
+            h = self.node_path.get(node_id)
+            if h is None or self._is_removed(h):
                 continue
-            if os.path.isdir(path):
-                for f in self._iter_files(path):
-                    if self._is_removed(f):
-                        continue
-                    if self._is_gitignored(f, is_dir=False):
-                        continue
-                    if self._ext_allowed(f, allow_exts):
+            if self.paths.is_dir(h):
+                for f in self._iter_files(h):
+                    if self._ext_allowed(self.paths.name(f), allow_exts):
                         added += self._add_selected_file(f)
-                        last_added_path = f
+                        last_added = f
             else:
-                if self._is_gitignored(path, is_dir=False):
+                if self._is_gitignored(h, is_dir=False):
                     continue
-                if self._ext_allowed(path, allow_exts):
-                    added += self._add_selected_file(path)
-                    last_added_path = path
+                if self._ext_allowed(self.paths.name(h), allow_exts):
+                    added += self._add_selected_file(h)
+                    last_added = h
 
         if added > 0:
             self._refresh_files_view()
-            if last_added_path:
-                self._select_file_in_files_view(last_added_path)
+            if last_added is not None:
+                self._select_file_in_files_view(last_added)
         elapsed = time.time() - start
         self.log(f"Arquivos adicionados: {added} em {elapsed:.2f}s")
 
+    def _on_add_by_content(self):
+        # Adiciona arquivos sob os nós selecionados cujo conteúdo casa com o padrão
+        pattern = self.entry_grep.get()
+        if not pattern:
+            self.log("Informe o texto ou regex a procurar.")
+            return
+        try:
+            matcher = ContentMatcher(pattern, self.var_grep_regex.get(), self.var_grep_icase.get())
+        except re.error as e:
+            messagebox.showerror(APP_TITLE, f"Regex inválida: {e}")
+            return
+        handles = []
+        for node_id in self.tree.selection():
+            h = self.node_path.get(node_id)
+            if h is not None and not self._is_removed(h):
+                handles.append(h)
+        if not handles:
+            self.log("Selecione pastas ou arquivos no tree.")
+            return
+        self._set_busy(True)
+        args = (handles, matcher, self._get_allowed_exts(), self._get_max_size_bytes(), self.var_multiprocess.get())
+        t = threading.Thread(target=self._worker_grep, args=args, daemon=True)
+        t.start()
+
+    def _worker_grep(self, handles, matcher, allow_exts, max_bytes, multiprocess):
+        start = time.time()
+        try:
+            # Mesmos filtros do "Adicionar selecionados do tree"; o de tamanho
+            # é aplicado em file_contains, sem abrir arquivos grandes demais
+            candidates = []
+            for h in handles:
+                if self.paths.is_dir(h):
+                    for f in self._iter_files(h):
+                        if self._ext_allowed(self.paths.name(f), allow_exts):
+                            candidates.append(f)
+                elif not self._is_gitignored(h, is_dir=False) and self._ext_allowed(self.paths.name(h), allow_exts):
+                    candidates.append(h)
+            paths = [self.paths.path(f) for f in candidates]
+            encodings = self.encoding_options
+            found = None
+            if multiprocess and MP_WORKERS > 1 and len(paths) >= GREP_MP_MIN_FILES:
+                try:
+                    found = self._grep_in_processes(paths, candidates, matcher, max_bytes, encodings)
+                except Exception as e:
+                    self.tlog(f"Processos indisponíveis ({e}); buscando em threads.")
+            if found is None:
+                # map preserva a ordem de varredura na lista final
+                with ThreadPoolExecutor(max_workers=GREP_WORKERS) as pool:
+                    found = list(pool.map(lambda p: file_contains(p, matcher, max_bytes, encodings), paths))
+            hits = [f for f, ok in zip(candidates, found) if ok]
+            self.result_queue.put(("grep_done", hits))
+            elapsed = time.time() - start
+            self.tlog(f"Busca por conteúdo: {len(hits)} de {len(candidates)} arquivo(s) casaram em {elapsed:.2f}s")
+        except Exception as e:
+            self.tlog(f"Erro na busca por conteúdo: {e}")
+        finally:
+            self.result_queue.put(("done_cleanup", None))
+
+    def _grep_in_processes(self, paths, candidates, matcher, max_bytes, encodings):
+        # Lotes como na leitura da geração; map preserva a ordem de varredura
+        # Lotes menores que os da geração para ocupar todos os processos
+        sizes = [max(0, self.file_sizes.get(f, 0)) for f in candidates]
+        per_batch = max(1, min(MP_BATCH_FILES, len(paths) // (MP_WORKERS * 4)))
+        batches = make_batches(paths, sizes, per_batch)
+        found = []
+        with ProcessPoolExecutor(max_workers=MP_WORKERS, mp_context=multiprocessing.get_context("spawn")) as pool:
+            args = [(b, matcher, max_bytes, encodings, {p: ENCODING_CACHE[p] for p in b if p in ENCODING_CACHE}) for b in batches]
+            for out, decisions in pool.map(grep_batch, *zip(*args)):
+                ENCODING_CACHE.update(decisions)
+                found.extend(out)
+        self.tlog(f"Busca por conteúdo em {MP_WORKERS} processo(s): {len(paths)} arquivo(s) em {len(batches)} lote(s)")
+        return found
+
+    def _add_grep_hits(self, hits):
+        added = 0
+        for h in hits:
+            added += self._add_selected_file(h)
+        if added > 0:
+            self._refresh_files_view()
+            self._select_file_in_files_view(hits[-1])
+        self.log(f"Arquivos adicionados por conteúdo: {added}")
+
     def _on_refresh_selected_files(self):
         # Atualiza arquivos selecionados na lista (revalida existência e força releitura futura)
         items = self.files_view.selection()
@@ -632,63 +2271,339 @@ class App(tk.Tk):
             return
         refreshed = 0
         missing = 0
+        max_bytes = self._get_max_size_bytes()
         for iid in items:
-            vals = self.files_view.item(iid, "values")
-            if not vals:
-                continue
-            path = vals[1]
+            h = int(iid)
+            self.file_sizes.pop(h, None)
+            self.prefetcher.invalidate(h)
+            path = self.paths.path(h)
             if os.path.isfile(path):
+                self.prefetcher.submit(h, path, max_bytes)
                 refreshed += 1
             else:
                 missing += 1
+        self._schedule_estimate(full=True)
         self.log(f"Arquivos atualizados: {refreshed} | Inexistentes: {missing}. O conteúdo será recarregado na geração.")
 
     def _on_clear_selected_list(self):
-        self.selected_files = []
-        self.selected_files_set = set()
+        for h in self.selected_files:
+            self.paths.set_flag(h, FLAG_SELECTED, False)
+        self.selected_files = array("i")
+        self.prefetcher.clear()
         for iid in self.files_view.get_children():
             self.files_view.delete(iid)
+        self.est_bytes = 0
+        self.est_count = 0
+        self.est_top = []
+        self._schedule_estimate()
         self.log("Lista de arquivos limpa.")
 
-    def _iter_files(self, root_path):
-        for dirpath, dirnames, filenames in os.walk(root_path):
-            kept = []
-            for d in list(dirnames):
-                full = os.path.join(dirpath, d)
-                if self._should_skip_path(full, True):
-                    continue
-                kept.append(d)
-            dirnames[:] = kept
-            for fn in filenames:
-                full = os.path.join(dirpath, fn)
-                if self._should_skip_path(full, False):
+    def _iter_files(self, root, epoch=None):
+        # Percorre o diretório (pré-ordem, como os.walk) gerando handles de
+        # arquivos não filtrados. Links seguem a política de links simbólicos.
+        # Com epoch, a varredura para assim que a sessão muda (a PathTable
+        # foi trocada e os handles deixam de valer).
+        visited = set()
+        stack = [root]
+        while stack:
+            if epoch is not None and epoch != self.session_epoch:
+                return
+            d = stack.pop()
+            try:
+                entries = self._scan_dir(d)
+            except OSError:
+                continue
+            subdirs = []
+            for name, is_dir, is_link in entries:
+                if epoch is not None and epoch != self.session_epoch:
+                    return
+                if is_link:
+                    is_dir = self._follow_link(d, name, visited)
+                    if is_dir is None:
+                        continue
+                child = self.paths.child(d, name, is_dir)
+                if self._should_skip_path(child, is_dir):
                     continue
-                yield full
+                if is_dir:
+                    subdirs.append(child)
+                else:
+                    yield child
+            stack.extend(reversed(subdirs))
 
-    def _add_selected_file(self, path):
-        p = norm_case_path(path)
-        if p in self.selected_files_set:
+    def _add_selected_file(self, h):
+        if self.paths.has_flag(h, FLAG_SELECTED):
             return 0
-        self.selected_files.append(p)
-        self.selected_files_set.add(p)
+        self.selected_files.append(h)
+        self.paths.set_flag(h, FLAG_SELECTED)
+        path = self.paths.path(h)
+        self.watcher.watch_file(h, path)
+        self.prefetcher.submit(h, path, self._get_max_size_bytes())
+        self._estimate_add(h)
         return 1
 
     def _refresh_files_view(self):
         for iid in self.files_view.get_children():
             self.files_view.delete(iid)
-        for p in self.selected_files:
-            name = os.path.basename(p)
-            self.files_view.insert("", "end", values=(name, p))
+        for h in self.selected_files:
+            status = self.prefetcher.status_of(h)
+            label = STATUS_LABELS.get(status, status) if status else "…"
+            self.files_view.insert("", "end", iid=str(h), values=(self.paths.name(h), self.paths.path(h), label))
 
-    def _select_file_in_files_view(self, path):
+    def _select_file_in_files_view(self, h):
         # Seleciona e foca o item recém-adicionado na lista
-        for iid in self.files_view.get_children():
-            vals = self.files_view.item(iid, "values")
-            if vals and vals[1] == path:
-                self.files_view.selection_set(iid)
-                self.files_view.focus(iid)
-                self.files_view.see(iid)
+        iid = str(h)
+        if self.files_view.exists(iid):
+            self.files_view.selection_set(iid)
+            self.files_view.focus(iid)
+            self.files_view.see(iid)
+
+    # ---------------------------------------------------------------------
+    # Estimativa de tamanho (apenas stat em cache, sem leitura)
+    # ---------------------------------------------------------------------
+    def _cached_size(self, h):
+        size = self.file_sizes.get(h)
+        if size is None:
+            try:
+                size = os.stat(self.paths.path(h)).st_size
+            except Exception:
+                size = -1
+            self.file_sizes[h] = size
+        return size
+
+    def _estimate_size(self, h, filters):
+        # Tamanho que o arquivo deve contribuir, ou -1 se será ignorado
+        allow_exts, max_bytes = filters
+        size = self._cached_size(h)
+        if size < 0 or size > max_bytes:
+            return -1
+        if not self._ext_allowed(self.paths.name(h), allow_exts):
+            return -1
+        if self.removed_paths and self._is_removed(h):
+            return -1
+        return size
+
+    def _estimate_count(self, h, size):
+        self.est_bytes += size
+        self.est_count += 1
+        if size <= 0:
+            return
+        if len(self.est_top) < ESTIMATE_TOP_N:
+            heapq.heappush(self.est_top, (size, h))
+        elif size > self.est_top[0][0]:
+            heapq.heapreplace(self.est_top, (size, h))
+
+    def _estimate_add(self, h):
+        if self.est_filters is not None:
+            size = self._estimate_size(h, self.est_filters)
+            if size >= 0:
+                self._estimate_count(h, size)
+        self._schedule_estimate()
+
+    def _schedule_estimate(self, full=False):
+        if full:
+            self.est_filters = None
+        if self._est_after_id is not None:
+            self.after_cancel(self._est_after_id)
+        self._est_after_id = self.after(ESTIMATE_DEBOUNCE_MS, self._update_estimate)
+
+    def _update_estimate(self):
+        # Só varre a seleção quando os filtros mudam; adições entram por
+        # _estimate_add e o texto do usuário só altera a própria parcela
+        self._est_after_id = None
+        if self.project_checking:
+            self.estimate_label.configure(text="Estimativa: validando projeto…")
+            return
+        filters = (self._get_allowed_exts(), self._get_max_size_bytes())
+        if filters != self.est_filters:
+            self.est_filters = filters
+            self.est_bytes = 0
+            self.est_count = 0
+            self.est_top = []
+            for h in self.selected_files:
+                size = self._estimate_size(h, filters)
+                if size >= 0:
+                    self._estimate_count(h, size)
+
+        if not self.selected_files:
+            self.estimate_label.configure(text="")
+            return
+
+        # Cabeçalhos de arquivo + texto do usuário; o FILE TREE não entra (exigiria varredura)
+        header = len(file_block_header(os.sep)) + 1
+        total = self.est_bytes + self.est_count * header + len(self.user_text.get("1.0", "end-1c"))
+        text = f"Estimativa: {fmt_bytes(total)} · ~{estimate_tokens(total):,} tokens · {self.est_count} arquivo(s)"
+
+        if self.est_top:
+            text += " · maiores: " + ", ".join(
+                f"{self.paths.name(h)} ({fmt_bytes(size)})" for size, h in sorted(self.est_top, reverse=True)
+            )
+
+        budget = self._get_budget_chars()
+        if budget:
+            text += f" · orçamento: {100.0 * total / budget:.0f}%"
+        self.estimate_label.configure(text=text)
+
+    # ---------------------------------------------------------------------
+    # Busca de arquivos (índice em memória)
+    # ---------------------------------------------------------------------
+    def _search_key(self, h, root):
+        # Nome da raiz + caminho relativo, como exibido nos resultados
+        root_path = self.paths.path(root)
+        base = os.path.basename(root_path.rstrip("\\/")) or root_path
+        return base + "/" + self.paths.relpath(h, root)
+
+    def _start_search_index(self, root, top=None):
+        # (Re)indexa em segundo plano os arquivos filtrados sob top (padrão: a raiz)
+        self.search_jobs += 1
+        top = root if top is None else top
+        args = (self.paths, root, top, self.session_epoch)
+        threading.Thread(target=self._worker_index, args=args, daemon=True).start()
+
+    def _worker_index(self, paths, root, top, epoch):
+        # paths: a tabela da sessão em que a indexação começou; se a sessão
+        # muda, _iter_files para e nada mais é gravado no índice novo
+        start = time.time()
+        found = set()
+        try:
+            for f in self._iter_files(top, epoch):
+                if epoch != self.session_epoch or root not in self.roots:
+                    return
+                self.search_index.add(f, self._search_key(f, root))
+                found.add(f)
+            if epoch != self.session_epoch:
+                return
+            # Descarta o que sumiu da subárvore desde a indexação anterior
+            self.search_index.discard_where(lambda h: h not in found and paths.is_within(h, top))
+            if top == root:
+                self.tlog(f"Índice de busca: {len(found)} arquivo(s) em {paths.path(root)} ({time.time() - start:.2f}s)")
+        except Exception as e:
+            self.tlog(f"Erro ao indexar para busca: {e}")
+        finally:
+            self.result_queue.put(("index_done", None))
+
+    def _update_search_index(self, targets, dirs):
+        # Aplica ao índice só as entradas afetadas por eventos do watcher.
+        # targets: entradas nomeadas (criadas/removidas/renomeadas);
+        # dirs: diretórios cuja listagem mudou sem saber qual entrada
+        for t in targets:
+            root = self._get_root_for_path(t)
+            if root is None:
+                continue
+            path = self.paths.path(t)
+            is_dir = os.path.isdir(path)
+            if os.path.islink(path):
+                is_dir = self._follow_link(self.paths.parent(t), self.paths.name(t), None)
+            if is_dir:
+                if not self._should_skip_path(t, True):
+                    self._start_search_index(root, t)
+            elif is_dir is not None and os.path.isfile(path) and not self._should_skip_path(t, False):
+                self.search_index.add(t, self._search_key(t, root))
+            else:
+                self.search_index.discard(t)
+                if self.paths.is_dir(t):
+                    self.search_index.discard_where(lambda h: self.paths.is_within(h, t))
+        for d in dirs:
+            root = self._get_root_for_path(d)
+            if root is None:
+                continue
+            try:
+                entries = self._list_dir(d)
+            except OSError:
+                self.search_index.discard_where(lambda h: self.paths.is_within(h, d))
+                continue
+            present = set()
+            for name, child, is_dir in entries:
+                if is_dir:
+                    # Subpastas já listadas seguem no índice; só as novas são varridas
+                    with self.dir_cache_lock:
+                        listed = child in self.dir_cache
+                    if not listed:
+                        self._start_search_index(root, child)
+                    present.add(child)
+                elif os.path.isfile(self.paths.path(child)):
+                    self.search_index.add(child, self._search_key(child, root))
+                    present.add(child)
+            self.search_index.discard_where(lambda h: self.paths.parent(h) == d and h not in present)
+        self._schedule_search()
+
+    def _schedule_search(self):
+        if self._search_after_id is not None:
+            self.after_cancel(self._search_after_id)
+        self._search_after_id = self.after(SEARCH_DEBOUNCE_MS, self._run_search)
+
+    def _run_search(self):
+        self._search_after_id = None
+        query = self.entry_search.get()
+        self.search_list.delete(0, "end")
+        self.search_hits = []
+        if not query.strip():
+            self.search_label.configure(text="indexando…" if self.search_jobs else "")
+            return
+        # Raízes vindas de um projeto só são indexadas na primeira busca
+        if self.search_pending:
+            for root in self.search_pending:
+                if root in self.roots:
+                    self._start_search_index(root)
+            self.search_pending = []
+            self.search_label.configure(text="indexando…")
+        start = time.time()
+        for h in self.search_index.search(query):
+            # Itens removidos do tree depois da indexação saem só aqui
+            root = self._get_root_for_path(h)
+            if root is None or self._is_removed(h):
+                continue
+            self.search_hits.append(h)
+            self.search_list.insert("end", self._search_key(h, root))
+        text = f"{len(self.search_hits)} resultado(s) em {(time.time() - start) * 1000:.0f} ms"
+        if self.search_jobs:
+            text += " · indexando…"
+        self.search_label.configure(text=text)
+
+    def _on_search_add(self):
+        picked = self.search_list.curselection()
+        if not picked:
+            return
+        allow_exts = self._get_allowed_exts()
+        added = 0
+        last_added = None
+        for i in picked:
+            h = self.search_hits[i]
+            if self._should_skip_path(h, is_dir=False):
+                continue
+            if self._ext_allowed(self.paths.name(h), allow_exts):
+                added += self._add_selected_file(h)
+                last_added = h
+        if added > 0:
+            self._refresh_files_view()
+            self._select_file_in_files_view(last_added)
+        self.log(f"Arquivos adicionados pela busca: {added}")
+
+    def _on_search_reveal(self):
+        # Expande só a cadeia de ancestrais, da raiz até o arquivo
+        picked = self.search_list.curselection()
+        if not picked:
+            return
+        h = self.search_hits[picked[0]]
+        chain = []
+        a = self.paths.parent(h)
+        while a >= 0:
+            chain.append(a)
+            if a in self.roots:
                 break
+            a = self.paths.parent(a)
+        for d in reversed(chain):
+            node_id = self.node_of.get(d)
+            if node_id is None:
+                break
+            self._populate_node(node_id)
+            self.tree.item(node_id, open=True)
+        node_id = self.node_of.get(h)
+        if node_id is None:
+            self.log("Arquivo não encontrado no tree.")
+            return
+        self.tree.selection_set(node_id)
+        self.tree.focus(node_id)
+        self.tree.see(node_id)
 
     # ---------------------------------------------------------------------
     # Rodapé: gerar, salvar, reset
@@ -705,40 +2620,78 @@ class App(tk.Tk):
         if not self.roots and not self.selected_files and not self.user_text.get("1.0", "end-1c").strip():
             messagebox.showinfo(APP_TITLE, "Nada a salvar.")
             return
+        # O destino é escolhido antes da geração para gravar em fluxo
+        file_path = filedialog.asksaveasfilename(
+            title="Salvar em arquivo",
+            defaultextension=".txt",
+            filetypes=[("Texto", "*.txt"), ("Texto gzip", "*.gz"), ("Texto xz", "*.xz"), ("Todos os arquivos", "*.*")]
+        )
+        if not file_path:
+            self.log("Salvar cancelado pelo usuário.")
+            return
         self._set_busy(True)
-        t = threading.Thread(target=self._worker_generate, args=("save",), daemon=True)
+        t = threading.Thread(target=self._worker_generate, args=("save", file_path), daemon=True)
         t.start()
 
     def _on_reset_all(self):
-        # Reseta todo o estado do app
+        self._reset_state()
+        self.user_text.delete("1.0", "end")
+        self._schedule_estimate(full=True)
+        self.log_text.configure(state="normal")
+        self.log_text.delete("1.0", "end")
+        self.log_text.configure(state="disabled")
+        self.log("Estado reiniciado.")
+
+    def _reset_state(self):
+        # Reseta pastas, seleção e caches (mantém configurações e texto)
+        self.session_epoch += 1
+        for iid in self.tree.get_children(""):
+            self._delete_node_recursive(iid)
+        self.watcher.clear()
+        self.prefetcher.clear()
+        with self.dir_cache_lock:
+            self.dir_cache = {}
+            self.dir_cache_epoch += 1
+        self.search_index.clear()
+        self.search_pending = []
+        self.search_hits = []
+        self.search_list.delete(0, "end")
+        self.entry_search.delete(0, "end")
+        self.search_label.configure(text="")
+        self.paths = PathTable()
         self.roots = []
         self.removed_paths = set()
         self.node_path = {}
-        self.node_is_dir = {}
+        self.node_of = {}
         self.populated_nodes = set()
         self.gitignores = {}
-        for iid in self.tree.get_children(""):
-            self._delete_node_recursive(iid)
-        self.selected_files = []
-        self.selected_files_set = set()
+        self.selected_files = array("i")
         for iid in self.files_view.get_children():
             self.files_view.delete(iid)
-        self.user_text.delete("1.0", "end")
-        self.last_output = None
-        self.log_text.configure(state="normal")
-        self.log_text.delete("1.0", "end")
-        self.log_text.configure(state="disabled")
-        self.log("Estado reiniciado.")
-
-    def _worker_generate(self, mode):
+        self.fingerprints = None
+        self.last_tree_digest = None
+        self.file_sizes = {}
+        # Estimativa zerada: nada da sessão anterior entra nos totais
+        self.project_checking = False
+        self.est_bytes = 0
+        self.est_count = 0
+        self.est_top = []
+        self.est_filters = None
+
+    def _worker_generate(self, mode, file_path=None):
         start = time.time()
         try:
-            content = self._build_output()
-            self.last_output = content
             if mode == "copy":
+                content = self._build_output()
                 self.result_queue.put(("copy_done", content))
             else:
-                self.result_queue.put(("save_done", content))
+                try:
+                    written = self._write_output(file_path)
+                except OSError as e:
+                    self.tlog(f"Erro ao salvar: {e}")
+                    self.result_queue.put(("save_error", e))
+                    return
+                self.result_queue.put(("save_done", written))
             elapsed = time.time() - start
             self.tlog(f"Geração concluída em {elapsed:.2f}s")
         except Exception as e:
@@ -752,7 +2705,10 @@ class App(tk.Tk):
         for b in (
             self.btn_add_folder,
             self.btn_remove_selected,
+            self.btn_open_project,
+            self.btn_save_project,
             self.btn_add_selected_from_tree,
+            self.btn_add_by_content,
             self.btn_refresh_files,
             self.btn_clear_list,
             self.btn_generate_copy,
@@ -763,6 +2719,176 @@ class App(tk.Tk):
         self.config(cursor="watch" if busy else "")
         self.update_idletasks()
 
+    # ---------------------------------------------------------------------
+    # Projeto: salvar/abrir sessão
+    # ---------------------------------------------------------------------
+    def _project_entries(self):
+        # Campos de texto persistidos no projeto (chave -> widget)
+        return {
+            "exts": self.entry_exts,
+            "max_mb": self.entry_max_mb,
+            "budget_chars": self.entry_budget_chars,
+            "budget_tokens": self.entry_budget_tokens,
+            "priority_exts": self.entry_priority_exts,
+            "tree_depth": self.entry_tree_depth,
+            "tree_fanout": self.entry_tree_fanout,
+            "tree_collapse": self.entry_tree_collapse,
+            "encodings": self.entry_encodings,
+            "encoding_overrides": self.entry_encoding_overrides,
+            "part_chars": self.entry_part_chars,
+            "compress_level": self.entry_compress_level,
+        }
+
+    def _project_flags(self):
+        return {
+            "compact_blank": self.var_compact_blank,
+            "compact_trailing": self.var_compact_trailing,
+            "compact_license": self.var_compact_license,
+            "compact_comments": self.var_compact_comments,
+            "delta": self.var_delta,
+            "multiprocess": self.var_multiprocess,
+        }
+
+    def _on_save_project(self):
+        file_path = filedialog.asksaveasfilename(
+            title="Salvar projeto",
+            defaultextension=".json",
+            filetypes=[("Projeto", "*.json"), ("Todos os arquivos", "*.*")]
+        )
+        if not file_path:
+            return
+        settings = {key: entry.get() for key, entry in self._project_entries().items()}
+        settings.update({key: var.get() for key, var in self._project_flags().items()})
+        settings["budget_policy"] = self.combo_budget_policy.get()
+        settings["symlinks"] = self.combo_symlinks.get()
+        project = {
+            "version": PROJECT_VERSION,
+            "roots": [self.paths.path(h) for h in self.roots],
+            "removed": [self.paths.path(h) for h in self.removed_paths],
+            "selected": [self.paths.path(h) for h in self.selected_files],
+            "user_text": self.user_text.get("1.0", "end-1c"),
+            "settings": settings,
+        }
+        try:
+            with open(file_path, "w", encoding="utf-8") as f:
+                json.dump(project, f, ensure_ascii=False, indent=1)
+        except OSError as e:
+            messagebox.showerror(APP_TITLE, f"Falha ao salvar o projeto: {e}")
+            return
+        self.log(f"Projeto salvo em: {file_path} ({len(self.roots)} pasta(s), {len(self.selected_files)} arquivo(s))")
+
+    def _on_open_project(self):
+        file_path = filedialog.askopenfilename(
+            title="Abrir projeto",
+            filetypes=[("Projeto", "*.json"), ("Todos os arquivos", "*.*")]
+        )
+        if not file_path:
+            return
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                project = json.load(f)
+            self._check_project_shape(project)
+        except (OSError, ValueError) as e:
+            messagebox.showerror(APP_TITLE, f"Falha ao abrir o projeto: {e}")
+            return
+        self._load_project(project)
+        self.log(f"Projeto aberto: {file_path}")
+
+    def _check_project_shape(self, project):
+        # Valida tudo antes de _reset_state: um projeto malformado não pode
+        # apagar a sessão atual. Levanta ValueError com o campo problemático.
+        if not isinstance(project, dict) or project.get("version") != PROJECT_VERSION:
+            raise ValueError("formato de projeto não reconhecido")
+        if not isinstance(project.get("settings", {}), (dict, type(None))):
+            raise ValueError("'settings' deve ser um objeto")
+        if not isinstance(project.get("user_text", ""), (str, type(None))):
+            raise ValueError("'user_text' deve ser texto")
+        for key in ("roots", "removed", "selected"):
+            items = project.get(key)
+            if items is None:
+                continue
+            if not isinstance(items, list) or not all(isinstance(p, str) and p for p in items):
+                raise ValueError(f"'{key}' deve ser uma lista de caminhos")
+
+    def _load_project(self, project):
+        # Restauração preguiçosa: só o estado é recriado. Nada é listado até
+        # um nó ser aberto; existência e tamanhos são conferidos em segundo plano.
+        start = time.time()
+        self._reset_state()
+
+        settings = project.get("settings") or {}
+        for key, entry in self._project_entries().items():
+            if isinstance(settings.get(key), str):
+                entry.delete(0, "end")
+                entry.insert(0, settings[key])
+        for key, var in self._project_flags().items():
+            if key in settings:
+                var.set(bool(settings[key]))
+        if settings.get("budget_policy") in BUDGET_POLICIES:
+            self.combo_budget_policy.set(settings["budget_policy"])
+        if settings.get("symlinks") in SYMLINK_POLICIES:
+            self.combo_symlinks.set(settings["symlinks"])
+            self.symlink_policy = SYMLINK_POLICIES[settings["symlinks"]]
+        self.encoding_options = self._get_encoding_options()
+        self.user_text.delete("1.0", "end")
+        self.user_text.insert("1.0", project.get("user_text") or "")
+
+        for path in project.get("roots") or []:
+            h = self.paths.add(path, is_dir=True)
+            if h in self.roots:
+                continue
+            self.roots.append(h)
+            self._insert_root(h)
+            self._load_gitignore_for_root(h)
+        self.search_pending = list(self.roots)
+        for path in project.get("removed") or []:
+            self._mark_removed(self.paths.add(path))
+        for path in project.get("selected") or []:
+            h = self.paths.add(path, is_dir=False)
+            if not self.paths.has_flag(h, FLAG_SELECTED):
+                self.selected_files.append(h)
+                self.paths.set_flag(h, FLAG_SELECTED)
+        self._refresh_files_view()
+
+        # Os tamanhos chegam com a validação; até lá a estimativa espera
+        self.project_checking = True
+        self.estimate_label.configure(text="Estimativa: validando projeto…")
+        # A tabela e o cache desta sessão vão junto: "Limpar tudo" troca ambos
+        args = (self.paths, self.file_sizes, list(self.roots), list(self.selected_files), self._get_max_size_bytes(), self.session_epoch)
+        threading.Thread(target=self._worker_check_project, args=args, daemon=True).start()
+        elapsed = time.time() - start
+        self.log(f"Projeto restaurado em {elapsed:.2f}s: {len(self.roots)} pasta(s), {len(self.selected_files)} arquivo(s) selecionado(s), {len(self.removed_paths)} removido(s)")
+
+    def _worker_check_project(self, paths, sizes, roots, selected, max_bytes, epoch):
+        # Confere caminhos do projeto e prepara o que _add_selected_file faria:
+        # tamanho para a estimativa, observação e pré-leitura
+        missing_roots = [paths.path(h) for h in roots if not os.path.isdir(paths.path(h))]
+        missing_files = 0
+        for h in selected:
+            if epoch != self.session_epoch:
+                return
+            path = paths.path(h)
+            try:
+                sizes[h] = os.stat(path).st_size
+            except OSError:
+                sizes[h] = -1
+                missing_files += 1
+                continue
+            self.watcher.watch_file(h, path)
+            self.prefetcher.submit(h, path, max_bytes)
+        self.result_queue.put(("project_checked", (epoch, missing_roots, missing_files)))
+
+    def _on_project_checked(self, payload):
+        epoch, missing_roots, missing_files = payload
+        if epoch != self.session_epoch:
+            return
+        for path in missing_roots:
+            self.log(f"Pasta do projeto não encontrada: {path}")
+        if missing_files:
+            self.log(f"Arquivos do projeto não encontrados: {missing_files}")
+        self.project_checking = False
+        self._schedule_estimate(full=True)
+
     # ---------------------------------------------------------------------
     # Filtros e .gitignore
     # ---------------------------------------------------------------------
@@ -788,32 +2914,139 @@ class App(tk.Tk):
             mb = DEFAULT_MAX_MB
         return int(mb * 1024 * 1024)
 
+    def _get_budget_chars(self):
+        # Retorna o orçamento efetivo em caracteres ou None se ilimitado
+        limits = []
+        for entry, factor in ((self.entry_budget_chars, 1), (self.entry_budget_tokens, CHARS_PER_TOKEN)):
+            raw = entry.get().strip().replace(".", "").replace(",", "").replace("_", "")
+            if not raw:
+                continue
+            try:
+                value = int(raw)
+            except Exception:
+                continue
+            if value > 0:
+                limits.append(value * factor)
+        return min(limits) if limits else None
+
+    def _get_budget_policy(self):
+        policy = BUDGET_POLICIES.get(self.combo_budget_policy.get(), "selection")
+        priority = []
+        for it in self.entry_priority_exts.get().split(","):
+            it = it.strip().lower()
+            if not it:
+                continue
+            if not it.startswith("."):
+                it = "." + it
+            priority.append(it)
+        return policy, priority
+
+    def _get_part_chars(self):
+        raw = self.entry_part_chars.get().strip().replace(".", "").replace(",", "").replace("_", "")
+        try:
+            value = int(raw)
+        except Exception:
+            return None
+        return value if value > 0 else None
+
+    def _get_tree_limits(self):
+        # (profundidade máx., itens por pasta, regras de resumo); None = sem limite
+        limits = []
+        for entry in (self.entry_tree_depth, self.entry_tree_fanout):
+            try:
+                value = int(entry.get().strip())
+            except Exception:
+                value = 0
+            limits.append(value if value > 0 else None)
+        rules = [r.strip().strip("/\\") for r in self.entry_tree_collapse.get().split(",")]
+        limits.append([r for r in rules if r])
+        return tuple(limits)
+
+    def _get_encoding_options(self):
+        # (alternativas, ((ext, codec), ...)); nomes de codec desconhecidos são ignorados
+        fallbacks = []
+        for name in self.entry_encodings.get().split(","):
+            name = name.strip().lower()
+            if name and self._codec_known(name):
+                fallbacks.append(name)
+        overrides = []
+        for item in self.entry_encoding_overrides.get().split(","):
+            ext, sep, name = item.partition("=")
+            ext = ext.strip().lower()
+            name = name.strip().lower()
+            if not sep or not ext or not self._codec_known(name):
+                continue
+            if not ext.startswith("."):
+                ext = "." + ext
+            overrides.append((ext, name))
+        return tuple(fallbacks), tuple(overrides)
+
+    def _codec_known(self, name):
+        try:
+            codecs.lookup(name)
+        except LookupError:
+            return False
+        return True
+
+    def _schedule_encoding_update(self):
+        if self._enc_after_id is not None:
+            self.after_cancel(self._enc_after_id)
+        self._enc_after_id = self.after(ESTIMATE_DEBOUNCE_MS, self._apply_encoding_options)
+
+    def _apply_encoding_options(self):
+        # Textos pré-lidos com as opções anteriores deixam de valer
+        self._enc_after_id = None
+        options = self._get_encoding_options()
+        if options == self.encoding_options:
+            return
+        self.encoding_options = options
+        self.prefetcher.clear()
+        max_bytes = self._get_max_size_bytes()
+        for h in self.selected_files:
+            self.prefetcher.submit(h, self.paths.path(h), max_bytes)
+
+    def _get_compress_level(self):
+        try:
+            level = int(self.entry_compress_level.get().strip())
+        except Exception:
+            level = DEFAULT_COMPRESS_LEVEL
+        return min(9, max(0, level))
+
+    def _get_compact_options(self):
+        return {
+            "blank": self.var_compact_blank.get(),
+            "trailing": self.var_compact_trailing.get(),
+            "license": self.var_compact_license.get(),
+            "comments": self.var_compact_comments.get(),
+        }
+
     def _ext_allowed(self, path, allowed_exts):
         ext = os.path.splitext(path)[1].lower()
         return ext in allowed_exts if allowed_exts else True
 
     def _load_gitignore_for_root(self, root):
-        gi = GitIgnore(root)
+        gi = GitIgnore(self.paths.path(root))
         gi.load()
         self.gitignores[root] = gi
 
-    def _get_root_for_path(self, path):
-        best = None
-        for r in self.roots:
-            if is_subpath(path, r):
-                if best is None or len(r) > len(best):
-                    best = r
-        return best
-
-    def _is_gitignored(self, path, is_dir):
-        root = self._get_root_for_path(path)
-        if not root:
+    def _get_root_for_path(self, h):
+        # Raiz mais profunda que contém h (subindo pela cadeia de pais)
+        parents = self.paths.parents
+        while h >= 0:
+            if h in self.roots:
+                return h
+            h = parents[h]
+        return None
+
+    def _is_gitignored(self, h, is_dir):
+        root = self._get_root_for_path(h)
+        if root is None:
             return False
         gi = self.gitignores.get(root)
-        if not gi:
+        if not gi or not gi.rules:
             return False
-        rel = os.path.relpath(path, root)
-        if rel == ".":
+        rel = self.paths.relpath(h, root)
+        if not rel:
             return False
         try:
             return gi.match(rel, is_dir)
@@ -827,105 +3060,305 @@ class App(tk.Tk):
             return True
         return False
 
-    def _is_removed(self, path):
-        p = norm_case_path(path)
-        for r in self.removed_paths:
-            if is_subpath(p, r):
+    def _summary_filters(self, d, root, visited):
+        # (rel, skip, follow, chain) para summarize_dir/count_dir_entries: os
+        # critérios de _list_dir sem criar handles (nomes ignorados, ocultos,
+        # .gitignore, itens removidos e política de links simbólicos)
+        gi = self.gitignores.get(root)
+        if not gi or not gi.rules:
+            gi = None
+        removed = {self.paths.relpath(h, root) for h in self.removed_paths if self.paths.is_within(h, d)}
+
+        def skip(rel, name, is_dir):
+            if rel in removed or self._should_skip_name(name, is_dir):
                 return True
-        return False
+            try:
+                return gi is not None and gi.match(rel, is_dir)
+            except Exception:
+                return False
+
+        def follow(path, chain):
+            target = self._link_target(path, visited)
+            if target is None or (target[0] and target[1] in chain):
+                return None
+            return target
+
+        # Pastas de d até a raiz, como em _link_closes_cycle
+        chain = set()
+        a = d
+        while a >= 0:
+            try:
+                st = os.stat(self.paths.path(a))
+                chain.add((st.st_dev, st.st_ino))
+            except OSError:
+                pass
+            if a in self.roots:
+                break
+            a = self.paths.parent(a)
+        return self.paths.relpath(d, root), skip, follow, frozenset(chain)
 
-    def _should_skip_path(self, path, is_dir):
-        name = os.path.basename(path)
-        if self._is_removed(path):
+    def _is_removed(self, h):
+        return self.paths.flag_in_chain(h, FLAG_REMOVED)
+
+    def _should_skip_path(self, h, is_dir):
+        if self._is_removed(h):
             return True
-        if self._should_skip_name(name, is_dir):
+        if self._should_skip_name(self.paths.name(h), is_dir):
             return True
-        if self._is_gitignored(path, is_dir):
+        if self._is_gitignored(h, is_dir):
             return True
         return False
 
+    # ---------------------------------------------------------------------
+    # Listagem de diretórios e mudanças no disco
+    # ---------------------------------------------------------------------
+    def _scan_dir(self, d):
+        # Listagem crua [(nome, is_dir, is_link)]. Fica em cache enquanto o
+        # diretório estiver sob observação; levanta OSError se não puder listar.
+        with self.dir_cache_lock:
+            entries = self.dir_cache.get(d)
+            epoch = self.dir_cache_epoch
+        if entries is not None:
+            return entries
+        path = self.paths.path(d)
+        watched = self.watcher.watch_dir(d, path)
+        entries = []
+        with os.scandir(path) as it:
+            for e in it:
+                try:
+                    is_dir = e.is_dir(follow_symlinks=False)
+                except OSError:
+                    is_dir = False
+                try:
+                    is_link = e.is_symlink()
+                except OSError:
+                    is_link = False
+                entries.append((e.name, is_dir, is_link))
+        # Descarta se houve invalidação durante a varredura
+        if watched:
+            with self.dir_cache_lock:
+                if epoch == self.dir_cache_epoch:
+                    self.dir_cache[d] = entries
+        return entries
+
+    def _list_dir(self, d, visited=None):
+        # Entradas visíveis (nome, handle, is_dir), pastas primeiro.
+        # visited: identidades já vistas na varredura corrente (ver _follow_link)
+        entries = []
+        for name, is_dir, is_link in self._scan_dir(d):
+            if is_link:
+                is_dir = self._follow_link(d, name, visited)
+                if is_dir is None:
+                    continue
+            child = self.paths.child(d, name, is_dir)
+            if self._should_skip_path(child, is_dir):
+                continue
+            entries.append((name, child, is_dir))
+        entries.sort(key=lambda x: (not x[2], x[0].lower()))
+        return entries
+
+    def _follow_link(self, d, name, visited):
+        # Aplica a política ao link d/name: devolve is_dir do alvo, ou None se
+        # o link deve ser omitido (política "Ignorar", link quebrado, ciclo ou,
+        # em "Seguir uma vez", alvo já visto). visited guarda (st_dev, st_ino)
+        # dos alvos já seguidos na varredura corrente.
+        target = self._link_target(os.path.join(self.paths.path(d), name), visited)
+        if target is None:
+            return None
+        is_dir, ident = target
+        if is_dir and self._link_closes_cycle(d, ident):
+            return None
+        return is_dir
+
+    def _link_target(self, path, visited):
+        # Parte da política que não depende de handles: (is_dir, identidade)
+        # do alvo, ou None se o link é omitido (exceto ciclos)
+        policy = self.symlink_policy
+        if policy == "skip":
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        ident = (st.st_dev, st.st_ino)
+        if policy == "follow_once":
+            # Alvo dentro de uma raiz já aparece pelo seu caminho real
+            if self._real_path_in_roots(path):
+                return None
+            if visited is not None:
+                if ident in visited:
+                    return None
+                visited.add(ident)
+        return stat.S_ISDIR(st.st_mode), ident
+
+    def _real_path_in_roots(self, path):
+        real = norm_case_path(os.path.realpath(path))
+        for root in self.roots:
+            r = norm_case_path(os.path.realpath(self.paths.path(root)))
+            if real == r or real.startswith(r.rstrip(os.sep) + os.sep):
+                return True
+        return False
+
+    def _link_closes_cycle(self, d, ident):
+        # O alvo é d ou um de seus ancestrais (até a raiz)?
+        a = d
+        while a >= 0:
+            try:
+                st = os.stat(self.paths.path(a))
+            except OSError:
+                return True
+            if (st.st_dev, st.st_ino) == ident:
+                return True
+            if a in self.roots:
+                break
+            a = self.paths.parent(a)
+        return False
+
+    def _on_symlink_policy_changed(self, event=None):
+        self.symlink_policy = SYMLINK_POLICIES.get(self.combo_symlinks.get(), "follow_once")
+        for node_id in list(self.populated_nodes):
+            if node_id in self.node_path:
+                self._refresh_node_children(node_id)
+        for root in self.roots:
+            self._start_search_index(root)
+        self._schedule_estimate(full=True)
+        self.log(f"Links simbólicos: {self.combo_symlinks.get()}")
+
+    def _invalidate_dir_cache(self, d, recursive=False):
+        with self.dir_cache_lock:
+            self.dir_cache_epoch += 1
+            self.dir_cache.pop(d, None)
+            cached = list(self.dir_cache) if recursive else ()
+        # O filtro roda fora do lock; o que for gravado depois já é novo
+        gone = [h for h in cached if self.paths.is_within(h, d)]
+        if gone:
+            with self.dir_cache_lock:
+                for h in gone:
+                    self.dir_cache.pop(h, None)
+
+    def _apply_fs_events(self, events):
+        # Marca como sujos só os diretórios/arquivos afetados e atualiza os
+        # nós correspondentes do tree e os caches dependentes
+        dirty_dirs = set()
+        dirty_files = set()
+        index_targets = set()
+        index_dirs = set()
+        reindex = False
+        for kind, h, name in events:
+            if kind == "overflow":
+                reindex = True
+                with self.dir_cache_lock:
+                    self.dir_cache_epoch += 1
+                    self.dir_cache.clear()
+                self.file_sizes.clear()
+                dirty_dirs.update(self.node_path[n] for n in self.populated_nodes if n in self.node_path)
+                continue
+            if h >= len(self.paths):
+                continue  # handle de uma tabela anterior ao "Limpar tudo"
+            target = self.paths.child(h, name) if name else h
+            if kind == "dir":
+                dirty_dirs.add(h)
+                if name:
+                    dirty_dirs.add(target)
+                    dirty_files.add(target)
+                    index_targets.add(target)
+                else:
+                    index_dirs.add(h)
+                    if self.paths.parent(h) >= 0:
+                        dirty_dirs.add(self.paths.parent(h))
+            else:
+                dirty_files.add(target)
+
+        max_bytes = None
+        for h in dirty_files:
+            self.file_sizes.pop(h, None)
+            if self.paths.has_flag(h, FLAG_SELECTED):
+                if max_bytes is None:
+                    max_bytes = self._get_max_size_bytes()
+                self.prefetcher.invalidate(h)
+                self.prefetcher.submit(h, self.paths.path(h), max_bytes)
+        refreshed = 0
+        for d in dirty_dirs:
+            self._invalidate_dir_cache(d)
+        for d in dirty_dirs:
+            node_id = self.node_of.get(d)
+            if node_id is not None and node_id in self.populated_nodes:
+                self._refresh_node_children(node_id)
+                refreshed += 1
+        if any(self.paths.has_flag(h, FLAG_SELECTED) for h in dirty_files):
+            self._schedule_estimate(full=True)
+        if reindex:
+            for root in self.roots:
+                self._start_search_index(root)
+        elif index_targets or index_dirs:
+            self._update_search_index(index_targets, index_dirs)
+        if refreshed:
+            self.log(f"Tree atualizado: {refreshed} pasta(s) alterada(s) no disco.")
+
     # ---------------------------------------------------------------------
     # File tree textual
     # ---------------------------------------------------------------------
     def _build_file_tree_text(self):
+        limits = self._get_tree_limits()
+        visited = set()
         lines = []
         for root in self.roots:
             if self._is_removed(root):
                 continue
-            lines.append(root)
-            lines.extend(self._tree_lines_for_dir(root, prefix=""))
+            lines.append(self.paths.path(root))
+            lines.extend(self._tree_lines_for_dir(root, "", root, 1, limits, visited))
         return "\n".join(lines)
 
-    def _tree_lines_for_dir(self, dir_path, prefix):
+    def _tree_lines_for_dir(self, d, prefix, root, depth, limits, visited):
+        max_depth, max_entries, rules = limits
         lines = []
         try:
-            entries = []
-            with os.scandir(dir_path) as it:
-                for e in it:
-                    name = e.name
-                    full = os.path.join(dir_path, name)
-                    try:
-                        is_dir = e.is_dir(follow_symlinks=False)
-                    except Exception:
-                        is_dir = False
-                    if self._should_skip_path(full, is_dir):
-                        continue
-                    entries.append((name, full, is_dir))
+            entries = self._list_dir(d, visited)
         except Exception:
             return lines
 
-        entries.sort(key=lambda x: (not x[2], x[0].lower()))
+        hidden = 0
+        if max_entries is not None and len(entries) > max_entries:
+            hidden = len(entries) - max_entries
+            entries = entries[:max_entries]
         count = len(entries)
-        for i, (name, full, is_dir) in enumerate(entries):
-            last = i == count - 1
+        for i, (name, child, is_dir) in enumerate(entries):
+            last = i == count - 1 and not hidden
             connector = "└── " if last else "├── "
-            lines.append(prefix + connector + name)
-            if is_dir:
+            if not is_dir:
+                lines.append(prefix + connector + name)
+            # Pastas resumidas ou no limite de profundidade não são percorridas
+            elif rules and match_collapse_rule(name, self.paths.relpath(child, root), rules):
+                files, size = summarize_dir(self.paths.path(child), *self._summary_filters(child, root, visited))
+                lines.append(prefix + connector + f"{name}/ ({fmt_count(files)} arquivo(s), {fmt_bytes(size)})")
+            elif max_depth is not None and depth >= max_depth:
+                n = count_dir_entries(self.paths.path(child), *self._summary_filters(child, root, visited))
+                lines.append(prefix + connector + f"{name}/ ({fmt_count(n)} item(ns))")
+            else:
+                lines.append(prefix + connector + name)
                 child_prefix = prefix + ("    " if last else "│   ")
-                lines.extend(self._tree_lines_for_dir(full, child_prefix))
+                lines.extend(self._tree_lines_for_dir(child, child_prefix, root, depth + 1, limits, visited))
+        if hidden:
+            lines.append(prefix + f"└── … (+{fmt_count(hidden)} item(ns))")
         return lines
 
     # ---------------------------------------------------------------------
     # Leitura de arquivos
     # ---------------------------------------------------------------------
-    def _read_text_file(self, path, max_bytes):
-        try:
-            st = os.stat(path)
-        except FileNotFoundError:
-            return None, "not_found"
-        except PermissionError:
-            return None, "no_perm"
-        except Exception:
-            return None, "stat_error"
-
-        if st.st_size > max_bytes:
-            return None, "too_large"
-
-        try:
-            with open(path, "rb") as f:
-                data = f.read()
-        except Exception:
-            return None, "read_error"
-
-        if b"\x00" in data:
-            return None, "binary_nul"
-
-        try:
-            text = data.decode("utf-8", errors="replace")
-        except Exception:
-            return None, "decode_error"
-
-        rep = text.count(REPLACEMENT_CHAR)
-        ratio = rep / max(1, len(text))
-        if rep > REPLACEMENT_ABS_THRESHOLD and ratio > REPLACEMENT_RATIO_THRESHOLD:
-            return None, "binary_ratio"
-
-        return text, "ok"
+    def _read_text_file(self, path, max_bytes, st=None):
+        return read_text_file(path, max_bytes, self.encoding_options, st)
 
     # ---------------------------------------------------------------------
     # Concatenação
     # ---------------------------------------------------------------------
     def _build_output(self):
+        return "".join(chunk for _, chunk in self._iter_output())
+
+    def _iter_output(self):
+        # Gera a saída em pedaços (label, texto): primeiro o cabeçalho com texto
+        # do usuário e FILE TREE, depois um bloco por arquivo. Assim a saída pode
+        # ser gravada em fluxo sem montar o prompt inteiro em memória.
+        # No modo delta só saem arquivos novos/modificados, mais um resumo.
         start = time.time()
         user_text = self._normalize_newlines(self.user_text.get("1.0", "end-1c"))
 
@@ -936,54 +3369,284 @@ class App(tk.Tk):
 
         allow_exts = self._get_allowed_exts()
         max_bytes = self._get_max_size_bytes()
+        compact = self._get_compact_options()
+        do_compact = any(compact.values())
+        saved_total = 0
+
+        prev = self.fingerprints
+        delta = self.var_delta.get()
+        if delta and prev is None:
+            self.tlog("Modo delta: nenhuma geração anterior; gerando tudo.")
+            delta = False
+        new_fps = {}
+        added, modified, deleted = [], [], []
+        unchanged = 0
 
         files_to_process = list(self.selected_files)
         total = len(files_to_process)
         ok = 0
         skipped = 0
 
-        parts = []
-        for path in files_to_process:
-            if self._is_removed(path):
+        candidates = []
+        stats = {}
+        seen = set()
+        dupes = set()
+        for h in files_to_process:
+            if self._is_removed(h):
                 skipped += 1
-                self.tlog(f"Ignorado (removido): {path}")
+                self.tlog(f"Ignorado (removido): {self.paths.path(h)}")
                 continue
-            if self._is_gitignored(path, is_dir=False):
+            if self._is_gitignored(h, is_dir=False):
                 skipped += 1
-                self.tlog(f"Ignorado (.gitignore): {path}")
+                self.tlog(f"Ignorado (.gitignore): {self.paths.path(h)}")
                 continue
-            if not self._ext_allowed(path, allow_exts):
+            if not self._ext_allowed(self.paths.name(h), allow_exts):
                 skipped += 1
-                self.tlog(f"Ignorado (extensão não permitida): {path}")
+                self.tlog(f"Ignorado (extensão não permitida): {self.paths.path(h)}")
                 continue
-
-            text, status = self._read_text_file(path, max_bytes)
+            # Caminho completo materializado só aqui, na saída
+            path = self.paths.path(h)
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+            # O mesmo arquivo físico (via link ou hard link) entra uma vez só,
+            # antes do delta e do orçamento
+            if st is not None and st.st_ino:
+                ident = (st.st_dev, st.st_ino)
+                if ident in seen:
+                    skipped += 1
+                    dupes.add(h)
+                    self.tlog(f"Ignorado (mesmo arquivo já incluído por outro caminho): {path}")
+                    continue
+                seen.add(ident)
+            stats[h] = st
+            candidates.append((path, h))
+
+        tree_digest = hashlib.blake2b(tree_text.encode("utf-8"), digest_size=16).digest()
+        if delta:
+            current = {h for _, h in candidates}
+            deleted = [self.paths.path(h) for h in prev if h not in current and h not in dupes]
+            # Arquivos com mesmo (tamanho, mtime) da última geração nem são abertos
+            changed = []
+            for path, h in candidates:
+                fp = prev.get(h)
+                if fp is not None:
+                    st = stats[h]
+                    if st is not None and fp[:2] == (st.st_size, st.st_mtime_ns):
+                        new_fps[h] = fp
+                        unchanged += 1
+                        continue
+                changed.append((path, h))
+            candidates = changed
+            if tree_digest == self.last_tree_digest:
+                tree_text = "(inalterado desde a última geração)"
+
+        head = self._output_head(user_text, tree_text)
+        budget = self._get_budget_chars()
+        if budget is not None:
+            room = budget - len(head) - 1
+            if room < 0:
+                self.tlog(
+                    f"AVISO: texto do usuário + FILE TREE ({len(head)} caracteres) já excedem o orçamento "
+                    f"({budget}); nenhum arquivo será incluído e a saída ficará acima do limite. "
+                    "Reduza o texto, limite o FILE TREE ou aumente o orçamento."
+                )
+            if delta:
+                # Reserva o resumo: cabeçalho com contagens e os removidos já
+                # conhecidos; cada candidato reserva a própria linha no plano
+                n = len(candidates)
+                room -= len(self._delta_summary([], [], deleted, unchanged + n)) + 2 * len(str(n))
+            planned = candidates
+            candidates = self._apply_budget(candidates, room, max_bytes, stats, summary_lines=delta)
+            skipped += len(planned) - len(candidates)
+            if prev:
+                # Omitidos pelo orçamento não foram enviados: mantêm a impressão
+                # anterior e continuam aparecendo como modificados depois
+                kept = {h for _, h in candidates}
+                for _, h in planned:
+                    if h not in kept and h in prev:
+                        new_fps[h] = prev[h]
+
+        yield None, head
+        out_chars = len(head)
+        prefetched = 0
+        codec_counts = {}
+        for path, h, st, body, status, from_cache in self._iter_bodies(candidates, max_bytes, stats):
+            if from_cache:
+                prefetched += 1
             if status == "ok":
                 ok += 1
-                body = self._normalize_newlines(text)
-                block = (
-                    "\n" +
-                    "=" * 80 + "\n" +
-                    f" ARQUIVO: {path}\n" +
-                    "=" * 80 + "\n" +
-                    body
-                )
-                parts.append(block)
+                decision = ENCODING_CACHE.get(path)
+                if decision is not None and decision[2] != "utf-8":
+                    codec_counts[decision[2]] = codec_counts.get(decision[2], 0) + 1
+                digest = hashlib.blake2b(body.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+                if st is not None:
+                    new_fps[h] = (st.st_size, st.st_mtime_ns, digest)
+                if delta:
+                    fp = prev.get(h)
+                    if fp is None:
+                        added.append(path)
+                    elif fp[2] == digest:
+                        unchanged += 1  # só o mtime mudou
+                        continue
+                    else:
+                        modified.append(path)
+                if do_compact:
+                    before = len(body.encode("utf-8"))
+                    body = compact_text(body, os.path.splitext(path)[1].lower(), compact)
+                    saved = before - len(body.encode("utf-8"))
+                    if saved > 0:
+                        saved_total += saved
+                        self.tlog(f"Compactado: {path} (-{saved} bytes)")
+                block = "\n" + file_block_header(path) + body
+                out_chars += len(block)
+                yield path, block
             else:
                 skipped += 1
-                if status == "too_large":
-                    self.tlog(f"Ignorado (maior que o limite): {path}")
-                elif status in ("binary_nul", "binary_ratio"):
-                    self.tlog(f"Ignorado (provável binário): {path}")
-                elif status == "not_found":
-                    self.tlog(f"Ignorado (não encontrado): {path}")
-                elif status == "no_perm":
-                    self.tlog(f"Ignorado (sem permissão): {path}")
-                else:
-                    self.tlog(f"Ignorado ({status}): {path}")
+                if delta and h in prev:
+                    deleted.append(path)
+                self.tlog(f"Ignorado ({STATUS_LABELS.get(status, status)}): {path}")
+
+        if delta:
+            summary = self._delta_summary(added, modified, deleted, unchanged)
+            out_chars += len(summary)
+            yield "RESUMO DE ALTERAÇÕES", summary
+
+        self.fingerprints = new_fps
+        self.last_tree_digest = tree_digest
 
         self.tlog(f"Arquivos processados: {ok} | Ignorados: {skipped} | Total selecionados: {total}")
+        if candidates:
+            self.tlog(f"Pré-leitura: {prefetched} de {len(candidates)} arquivo(s) já estavam em cache")
+        if delta:
+            self.tlog(f"Delta: +{len(added)} ~{len(modified)} -{len(deleted)} | Inalterados (não emitidos): {unchanged}")
+        if do_compact:
+            self.tlog(f"Compactação: {saved_total} bytes economizados")
+        if codec_counts:
+            used = ", ".join(f"{c}: {n}" for c, n in sorted(codec_counts.items()))
+            self.tlog(f"Codificações além de UTF-8: {used}")
 
+        elapsed = time.time() - start
+        self.tlog(f"Tamanho final: {out_chars} caracteres (~{estimate_tokens(out_chars)} tokens)")
+        if budget is not None and out_chars > budget:
+            self.tlog(f"AVISO: saída com {out_chars} caracteres, acima do orçamento de {budget}.")
+        self.tlog(f"Concatenação concluída em {elapsed:.2f}s")
+
+    def _iter_bodies(self, candidates, max_bytes, stats):
+        # Gera (path, h, stat, corpo normalizado | None, status, veio_do_cache)
+        # na ordem de seleção. O que não está na pré-leitura é lido na própria
+        # thread ou, em seleções grandes, em processos de trabalho.
+        # stats: handle -> stat feito ao montar os candidatos (None se falhou)
+        plan = []
+        jobs = []
+        job_sizes = []
+        for path, h in candidates:
+            st = stats.get(h)
+            cached = self.prefetcher.get(h, st, max_bytes)
+            plan.append((path, h, st, cached))
+            if cached is None:
+                jobs.append((path, st))
+                job_sizes.append(st.st_size if st is not None else 0)
+
+        pool = None
+        results = None
+        if self.var_multiprocess.get() and MP_WORKERS > 1 and len(jobs) >= MP_MIN_FILES:
+            try:
+                # spawn: o processo da GUI tem threads, fork não é seguro
+                pool = ProcessPoolExecutor(max_workers=MP_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+                batches = make_batches(jobs, job_sizes)
+                results = self._pool_results(pool, batches, max_bytes)
+                self.tlog(f"Leitura em {MP_WORKERS} processo(s): {len(jobs)} arquivo(s) em {len(batches)} lote(s)")
+            except Exception as e:
+                self.tlog(f"Processos indisponíveis ({e}); lendo na thread.")
+                results = None
+        try:
+            for path, h, st, cached in plan:
+                if cached is not None:
+                    text, status = cached
+                    yield path, h, st, self._normalize_newlines(text) if status == "ok" else None, status, True
+                    continue
+                if results is not None:
+                    try:
+                        body, status = next(results)
+                    except Exception as e:
+                        self.tlog(f"Falha na leitura em processos ({e}); continuando na thread.")
+                        results = None
+                if results is None:
+                    text, status = self._read_text_file(path, max_bytes, st)
+                    body = self._normalize_newlines(text) if status == "ok" else None
+                yield path, h, st, body, status, False
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+    def _pool_results(self, pool, batches, max_bytes):
+        # Resultados em ordem, com poucos lotes em voo para limitar a memória.
+        # Decisões de codificação já conhecidas vão junto com cada lote.
+        encodings = self.encoding_options
+        pending = deque()
+        it = iter(batches)
+        for batch in itertools.islice(it, MP_WORKERS * 2):
+            pending.append(self._submit_batch(pool, batch, max_bytes, encodings))
+        while pending:
+            out, decisions = pending.popleft().result()
+            ENCODING_CACHE.update(decisions)
+            batch = next(it, None)
+            if batch is not None:
+                pending.append(self._submit_batch(pool, batch, max_bytes, encodings))
+            yield from out
+
+    def _submit_batch(self, pool, batch, max_bytes, encodings):
+        known = {p: ENCODING_CACHE[p] for p, _ in batch if p in ENCODING_CACHE}
+        return pool.submit(read_batch, batch, max_bytes, encodings, known)
+
+    def _delta_summary(self, added, modified, deleted, unchanged):
+        out = ["", "", "===== RESUMO DE ALTERAÇÕES =====", ""]
+        out.append(f"Adicionados: {len(added)} | Modificados: {len(modified)} | Removidos: {len(deleted)} | Inalterados: {unchanged}")
+        out.extend(f"+ {p}" for p in added)
+        out.extend(f"~ {p}" for p in modified)
+        out.extend(f"- {p}" for p in deleted)
+        return "\n".join(out) + "\n"
+
+    def _write_output(self, file_path):
+        # Grava a saída em fluxo; com limite de parte, divide em arquivos numerados.
+        # Destinos .gz/.xz são comprimidos durante a geração.
+        start = time.time()
+        level = self._get_compress_level()
+        part_chars = self._get_part_chars()
+        if part_chars is None:
+            out = OutputFile(file_path, level)
+            try:
+                for _, chunk in self._iter_output():
+                    out.write(chunk)
+            finally:
+                raw_bytes = out.close()
+            paths = [file_path]
+            written = [file_path]
+        else:
+            writer = PartWriter(file_path, part_chars, level)
+            try:
+                for label, chunk in self._iter_output():
+                    writer.write(chunk, label)
+            finally:
+                paths = writer.close()
+            raw_bytes = writer.raw_bytes
+            written = paths + [writer.manifest_path()]
+            self.tlog(f"Saída dividida em {len(paths)} parte(s). Manifesto: {writer.manifest_path()}")
+
+        compression = split_compress_ext(file_path)[1]
+        if compression:
+            elapsed = max(time.time() - start, 1e-6)
+            disk_bytes = sum(os.path.getsize(p) for p in paths)
+            ratio = 100.0 * disk_bytes / max(1, raw_bytes)
+            self.tlog(
+                f"Compressão {compression} (nível {level}): {fmt_bytes(raw_bytes)} -> {fmt_bytes(disk_bytes)} "
+                f"({ratio:.1f}%) em {elapsed:.2f}s, {fmt_bytes(raw_bytes / elapsed)}/s"
+            )
+        return written
+
+    def _output_head(self, user_text, tree_text):
         out = []
         out.append("===== TEXTO DO USUÁRIO =====")
         out.append("")
@@ -995,30 +3658,47 @@ class App(tk.Tk):
         out.append("")
         out.append("===== CONTEÚDO DE ARQUIVOS =====")
         out.append("")
-        out.extend(parts)
-
-        final_text = "\n".join(out)
-
-        elapsed = time.time() - start
-        self.tlog(f"Tamanho final: {len(final_text)} caracteres")
-        self.tlog(f"Concatenação concluída em {elapsed:.2f}s")
-
-        return final_text
+        return "\n".join(out)
+
+    def _apply_budget(self, items, budget_chars, max_bytes, stats, summary_lines=False):
+        # Planeja pelo tamanho do stat, sem abrir arquivos. Os que não cabem
+        # no orçamento nunca são lidos. items: [(path, handle)]; stats: handle
+        # -> stat já feito em _iter_output.
+        # summary_lines: cada arquivo também custa sua linha no resumo do delta
+        entries = []
+        for path, h in items:
+            st = stats.get(h)
+            size = st.st_size if st is not None else 0  # erro será reportado na leitura
+            if size > max_bytes:
+                size = 0  # será ignorado por tamanho na leitura
+            cost = size + len(path) + 3 if summary_lines else size
+            entries.append((path, cost, h, size))
+
+        policy, priority = self._get_budget_policy()
+        admitted, omitted = plan_budget(entries, max(0, budget_chars), policy, priority)
+        if omitted:
+            omitted_bytes = 0
+            for path, _, _, size in omitted:
+                omitted_bytes += size
+                self.tlog(f"Ignorado (fora do orçamento, {size} bytes): {path}")
+            self.tlog(
+                f"Orçamento atingido: {len(omitted)} arquivo(s) omitido(s), {omitted_bytes} bytes "
+                f"(~{estimate_tokens(omitted_bytes)} tokens) não lidos"
+            )
+        return [(path, h) for path, _, h, _ in admitted]
 
     # ---------------------------------------------------------------------
     # Normalização de quebras de linha
     # ---------------------------------------------------------------------
     def _normalize_newlines(self, s):
-        if s is None:
-            return ""
-        s = s.replace("\r\n", "\n").replace("\r", "\n")
-        return s
+        return normalize_newlines(s)
 
     def _normalize_for_clipboard(self, s):
         return self._normalize_newlines(s)
 
 
 def main():
+    multiprocessing.freeze_support()
     app = App()
     app.mainloop()
 
@@ -0,0 +1,56 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from main import PartWriter  # noqa: E402
+
+
+class PartWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.base = os.path.join(self.tmp.name, "out.txt")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _read(self, paths):
+        out = []
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                out.append(f.read())
+        return out
+
+    def test_cabecalho_maior_que_uma_parte_aponta_a_parte_seguinte(self):
+        writer = PartWriter(self.base, 1024)
+        writer.write("linha\n" * 400)
+        parts = self._read(writer.close())
+        self.assertGreater(len(parts), 1)
+        self.assertTrue(parts[0].endswith("[... continua na parte 02 ...]\n"))
+
+    def test_sobra_da_quebra_fica_na_parte_com_o_marcador(self):
+        writer = PartWriter(self.base, 1024)
+        writer.write("a" * 10 + "\n", "A")
+        writer.write("b\n" * 1001 + "b", "B")  # 2003 caracteres
+        parts = self._read(writer.close())
+        for text in parts[1:]:
+            self.assertNotEqual(text.strip(), "[... continuação de B ...]")
+        self.assertTrue(parts[1].startswith("[... continuação de B ...]\nb"))
+        self.assertEqual("".join(parts).count("b"), 1002)
+
+    def test_bloco_inteiro_vai_para_a_proxima_parte(self):
+        writer = PartWriter(self.base, 1024)
+        writer.write("x" * 600, "A")
+        writer.write("y" * 600, "B")
+        paths = writer.close()
+        self.assertEqual(self._read(paths), ["x" * 600, "y" * 600])
+        with open(writer.manifest_path(), encoding="utf-8") as f:
+            manifest = f.read()
+        self.assertIn("out.part01.txt\n  A\n", manifest)
+        self.assertIn("out.part02.txt\n  B\n", manifest)
+
+
+if __name__ == "__main__":
+    unittest.main()